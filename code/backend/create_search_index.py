@@ -9,6 +9,16 @@ This script creates a search index that enables full-text search on:
 - secondaryMuscles
 - equipment
 - category
+
+Usage:
+  python create_search_index.py                   # Create the exercises index
+  python create_search_index.py --update          # Apply SEARCH_INDEX_DEFINITION to the existing index
+  python create_search_index.py --list            # List the search indexes
+  python create_search_index.py --workout-cache   # Create the workout cache vector index
+
+An exercises index created before storedSource was added to SEARCH_INDEX_DEFINITION needs
+--update once; until that has finished rebuilding, test_search_index.py keeps fetching full
+documents instead of using returnStoredSource.
 """
 
 from pymongo import MongoClient
@@ -28,6 +38,72 @@ from connect import (
 COLLECTION_NAME = "exercises"
 SEARCH_INDEX_NAME = "exercises_prod"
 
+# MongoDB Search index definition
+# Based on the fields used in get_started_llm.py:
+# paths_all = ["name","instructions","primaryMuscles","secondaryMuscles","equipment","category"]
+# 
+# Field structure in documents:
+# - name: single string (e.g., "90/90 Hamstring")
+# - instructions: array of strings (multiple steps/lines)
+# - primaryMuscles: array of strings (e.g., ["hamstrings"])
+# - secondaryMuscles: array of strings (e.g., ["calves"])
+# - equipment: single string (e.g., "body only")
+# - category: single string (e.g., "stretching")
+#
+# Note: MongoDB Atlas Search automatically handles arrays when using "string" type
+# - It will index all elements in an array for text search
+# - Multi-value fields work seamlessly with the search queries
+SEARCH_INDEX_DEFINITION = {
+    "mappings": {
+        "dynamic": False,  # Explicit field mapping for better control
+        "fields": {
+            "name": {
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            },
+            "instructions": {
+                # Array of strings - automatically indexes all instruction steps
+                # Search will match across all elements in the array
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            },
+            "primaryMuscles": {
+                # Array of strings - automatically indexes all muscle names
+                # Supports text search across all values in the array
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            },
+            "secondaryMuscles": {
+                # Array of strings - automatically indexes all muscle names
+                # Supports text search across all values in the array
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            },
+            "equipment": {
+                # Single string, but could be array - string type handles both
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            },
+            "category": {
+                # Single string - full-text searchable
+                "type": "string",
+                "analyzer": "lucene.standard",
+                "searchAnalyzer": "lucene.standard"
+            }
+        }
+    },
+    # Keep the fields the search scripts display in the index itself, so queries using
+    # "returnStoredSource" are answered from the index without fetching the full documents
+    "storedSource": {
+        "include": ["name", "category", "equipment", "primaryMuscles", "secondaryMuscles"]
+    }
+}
+
 def create_search_index():
     """Create a MongoDB Atlas Search index for the exercises collection."""
     
@@ -65,67 +141,8 @@ def create_search_index():
         if doc_count == 0:
             print("⚠️  Warning: Collection is empty. The search index will still be created.")
         
-        # Define the MongoDB Search index
-        # Based on the fields used in get_started_llm.py:
-        # paths_all = ["name","instructions","primaryMuscles","secondaryMuscles","equipment","category"]
-        # 
-        # Field structure in documents:
-        # - name: single string (e.g., "90/90 Hamstring")
-        # - instructions: array of strings (multiple steps/lines)
-        # - primaryMuscles: array of strings (e.g., ["hamstrings"])
-        # - secondaryMuscles: array of strings (e.g., ["calves"])
-        # - equipment: single string (e.g., "body only")
-        # - category: single string (e.g., "stretching")
-        #
-        # Note: MongoDB Atlas Search automatically handles arrays when using "string" type
-        # - It will index all elements in an array for text search
-        # - Multi-value fields work seamlessly with the search queries
         search_index_model = SearchIndexModel(
-            definition={
-                "mappings": {
-                    "dynamic": False,  # Explicit field mapping for better control
-                    "fields": {
-                        "name": {
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        },
-                        "instructions": {
-                            # Array of strings - automatically indexes all instruction steps
-                            # Search will match across all elements in the array
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        },
-                        "primaryMuscles": {
-                            # Array of strings - automatically indexes all muscle names
-                            # Supports text search across all values in the array
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        },
-                        "secondaryMuscles": {
-                            # Array of strings - automatically indexes all muscle names
-                            # Supports text search across all values in the array
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        },
-                        "equipment": {
-                            # Single string, but could be array - string type handles both
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        },
-                        "category": {
-                            # Single string - full-text searchable
-                            "type": "string",
-                            "analyzer": "lucene.standard",
-                            "searchAnalyzer": "lucene.standard"
-                        }
-                    }
-                }
-            },
+            definition=SEARCH_INDEX_DEFINITION,
             name=SEARCH_INDEX_NAME,
         )
         
@@ -177,6 +194,101 @@ def create_search_index():
         return False
 
 
+def create_workout_cache_vector_index():
+    """Create the Atlas Vector Search index used by the semantic workout cache."""
+    from workout_cache import CACHE_COLLECTION_NAME, CACHE_VECTOR_INDEX_NAME, EMBEDDING_DIMENSIONS
+    
+    if not os.path.exists(CERTIFICATE_FILE):
+        print(f"❌ Error: Certificate file '{CERTIFICATE_FILE}' not found.")
+        return False
+    
+    try:
+        print("🔌 Connecting to MongoDB Atlas...")
+        client = MongoClient(
+            MONGODB_URI,
+            tls=True,
+            tlsCertificateKeyFile=CERTIFICATE_FILE,
+            serverSelectionTimeoutMS=10000
+        )
+        
+        client.admin.command('ping')
+        print(f"✅ Connected to MongoDB Atlas")
+        
+        collection = client[DATABASE_NAME][CACHE_COLLECTION_NAME]
+        
+        # Vector field for similarity lookups, plus the fields used in the $vectorSearch filter
+        search_index_model = SearchIndexModel(
+            definition={
+                "fields": [
+                    {
+                        "type": "vector",
+                        "path": "prompt_embedding",
+                        "numDimensions": EMBEDDING_DIMENSIONS,
+                        "similarity": "cosine"
+                    },
+                    {"type": "filter", "path": "prompt_version"},
+                    {"type": "filter", "path": "expires_at"}
+                ]
+            },
+            name=CACHE_VECTOR_INDEX_NAME,
+            type="vectorSearch",
+        )
+        
+        print(f"\n🔨 Creating vector search index '{CACHE_VECTOR_INDEX_NAME}' on '{CACHE_COLLECTION_NAME}'...")
+        result = collection.create_search_index(model=search_index_model)
+        print(f"✅ Vector search index created successfully!")
+        print(f"   Index name: {result}")
+        
+        client.close()
+        print("\n🔌 Connection closed.")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error creating vector search index: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def update_search_index():
+    """Replace the definition of the existing exercises search index with SEARCH_INDEX_DEFINITION."""
+    if not os.path.exists(CERTIFICATE_FILE):
+        print(f"❌ Error: Certificate file '{CERTIFICATE_FILE}' not found.")
+        return False
+    
+    try:
+        print("🔌 Connecting to MongoDB Atlas...")
+        client = MongoClient(
+            MONGODB_URI,
+            tls=True,
+            tlsCertificateKeyFile=CERTIFICATE_FILE,
+            serverSelectionTimeoutMS=10000
+        )
+        
+        client.admin.command('ping')
+        print(f"✅ Connected to MongoDB Atlas")
+        
+        collection = client[DATABASE_NAME][COLLECTION_NAME]
+        
+        print(f"\n🔨 Updating search index '{SEARCH_INDEX_NAME}'...")
+        collection.update_search_index(SEARCH_INDEX_NAME, SEARCH_INDEX_DEFINITION)
+        print(f"✅ Search index update submitted!")
+        print(f"\nℹ️  Note: Atlas rebuilds the index in the background; the old definition")
+        print(f"   keeps serving queries until the rebuild is complete.")
+        
+        client.close()
+        print("\n🔌 Connection closed.")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error updating search index: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def list_search_indexes():
     """List all search indexes for the exercises collection."""
     try:
@@ -234,10 +346,28 @@ if __name__ == "__main__":
         help="List existing search indexes instead of creating one"
     )
     
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Update the definition of the existing exercises search index"
+    )
+    
+    parser.add_argument(
+        "--workout-cache",
+        action="store_true",
+        help="Create the vector search index for the workout cache collection"
+    )
+    
     args = parser.parse_args()
     
     if args.list:
         list_search_indexes()
+    elif args.update:
+        success = update_search_index()
+        sys.exit(0 if success else 1)
+    elif args.workout_cache:
+        success = create_workout_cache_vector_index()
+        sys.exit(0 if success else 1)
     else:
         success = create_search_index()
         sys.exit(0 if success else 1)
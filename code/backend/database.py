@@ -1,7 +1,7 @@
 """Database connection configuration and utilities."""
 import os
 import logging
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
 logger = logging.getLogger(__name__)
@@ -70,5 +70,25 @@ def connect_to_mongodb():
 
 
 def get_database():
-    """Get the database instance."""
+    """
+    Get the database instance.
+
+    Used as a FastAPI dependency (Depends(get_database)). The connection is made once in the
+    application lifespan, which aborts startup if MongoDB is unreachable, so this never returns None
+    while requests are being served.
+    """
     return db
+
+
+def ensure_indexes(db):
+    """
+    Create the secondary indexes used by the API's hot queries.
+
+    The string '_id' lookups on users, workouts and sets are already served by the
+    built-in unique '_id' index, so only non-'_id' access paths need indexes here.
+    """
+    # Latest history entry per user: find_one({'user_id': ...}, sort=[('created_at', -1)])
+    db["history"].create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    # Exercise deletion checks whether any set still references the exercise
+    db["sets"].create_index("exercise_id")
+    logger.info("Ensured indexes on history and sets collections")
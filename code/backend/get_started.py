@@ -19,14 +19,20 @@ Usage:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uuid
 import json
 import sys
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
+# Independent API calls made in parallel; matches the session's connection pool size
+REQUEST_WORKERS = 4
+
 
 class WorkoutSetup:
     def __init__(self, api_base: str = "http://localhost:8000"):
@@ -34,6 +40,16 @@ class WorkoutSetup:
         self.user_id = None
         self.created_sets = {}
         self.created_workouts = {}
+        self.known_exercise_ids = set()  # Exercises confirmed to exist in the API
+        
+        # One session for all API calls, so they reuse a keep-alive connection.
+        # Connection failures and 502/503/504 on reads are retried with backoff; POSTs are
+        # only retried when the connection could not be made, as they create data.
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REQUEST_WORKERS, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
     
     def create_user(self, user_id: Optional[str] = None) -> str:
         """Create a new user. If user_id is provided, use it; otherwise generate a UUID."""
@@ -41,7 +57,7 @@ class WorkoutSetup:
             user_id = str(uuid.uuid4())
         
         print(f"\n📝 Creating user with ID: {user_id}")
-        response = requests.post(f"{self.api_base}/users/{user_id}")
+        response = self.session.post(f"{self.api_base}/users/{user_id}")
         
         if response.status_code == 201 or response.status_code == 200:
             print(f"✅ User created successfully: {user_id}")
@@ -61,7 +77,7 @@ class WorkoutSetup:
         
         try:
             # Use GET /exercises/ endpoint with pagination
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_base}/exercises/",
                 params={"skip": 0, "limit": limit}
             )
@@ -69,6 +85,8 @@ class WorkoutSetup:
             if response.status_code == 200:
                 exercises = response.json()
                 print(f"✅ Found {len(exercises)} exercise(s) from API")
+                # Exercises listed by the API exist, so creating their sets needs no extra check
+                self.known_exercise_ids.update(e.get('id') for e in exercises)
                 return exercises
             elif response.status_code == 500:
                 print(f"⚠️  API error: {response.json().get('detail', 'Unknown error')}")
@@ -173,10 +191,18 @@ class WorkoutSetup:
         return selected
     
     def check_exercise_exists(self, exercise_id: str) -> bool:
-        """Check if an exercise exists using GET /exercises/{exercise_id} endpoint."""
+        """
+        Check if an exercise exists using GET /exercises/{exercise_id} endpoint.
+        Exercises already seen in the API are not fetched again.
+        """
+        if exercise_id in self.known_exercise_ids:
+            return True
         try:
-            response = requests.get(f"{self.api_base}/exercises/{exercise_id}")
-            return response.status_code == 200
+            response = self.session.get(f"{self.api_base}/exercises/{exercise_id}")
+            if response.status_code == 200:
+                self.known_exercise_ids.add(exercise_id)
+                return True
+            return False
         except Exception:
             return False
     
@@ -218,7 +244,7 @@ class WorkoutSetup:
             set_data["duration_sec"] = duration_sec
         
         print(f"  Creating set for {exercise_name} (exercise_id: {exercise_id})...")
-        response = requests.post(f"{self.api_base}/sets/", json=set_data)
+        response = self.session.post(f"{self.api_base}/sets/", json=set_data)
         
         if response.status_code in [200, 201]:
             set_result = response.json()
@@ -249,10 +275,12 @@ class WorkoutSetup:
             all_set_ids.extend(exercises_ids)
         
         if create_missing_sets:
-            missing_sets = []
-            for set_id in all_set_ids:
-                if not self.check_set_exists(set_id):
-                    missing_sets.append(set_id)
+            # Sets created by this script are known to exist; check the rest concurrently
+            created_set_ids = set(self.created_sets.values())
+            unknown_set_ids = [set_id for set_id in all_set_ids if set_id not in created_set_ids]
+            with ThreadPoolExecutor(max_workers=REQUEST_WORKERS) as executor:
+                exists = list(executor.map(self.check_set_exists, unknown_set_ids))
+            missing_sets = [set_id for set_id, found in zip(unknown_set_ids, exists) if not found]
             
             if missing_sets:
                 print(f"  ⚠️  Warning: {len(missing_sets)} set(s) not found: {missing_sets}")
@@ -263,7 +291,7 @@ class WorkoutSetup:
             "workout_plan": day_plans
         }
         
-        response = requests.post(f"{self.api_base}/workouts/", json=workout_data)
+        response = self.session.post(f"{self.api_base}/workouts/", json=workout_data)
         
         if response.status_code in [200, 201]:
             result = response.json()
@@ -281,12 +309,12 @@ class WorkoutSetup:
     
     def check_workout_exists(self, workout_id: str) -> bool:
         """Check if a workout exists."""
-        response = requests.get(f"{self.api_base}/workouts/{workout_id}")
+        response = self.session.get(f"{self.api_base}/workouts/{workout_id}")
         return response.status_code == 200
     
     def check_set_exists(self, set_id: str) -> bool:
         """Check if a set exists."""
-        response = requests.get(f"{self.api_base}/sets/{set_id}")
+        response = self.session.get(f"{self.api_base}/sets/{set_id}")
         return response.status_code == 200
     
     def associate_workout_with_user(self, workout_id: str, create_if_missing: bool = False) -> bool:
@@ -307,7 +335,7 @@ class WorkoutSetup:
             return False
         
         print(f"  Associating workout {workout_id} with user {self.user_id}...")
-        response = requests.post(
+        response = self.session.post(
             f"{self.api_base}/users/{self.user_id}/workouts/{workout_id}"
         )
         
@@ -336,13 +364,11 @@ class WorkoutSetup:
         
         # Create sets for all selected exercises
         print("\n🔨 Creating sets for selected exercises...")
-        set_ids = []
-        for exercise in selected_exercises:
-            # Default parameters - could be made configurable
-            reps = 10  # Default reps
-            set_id = self.create_set(exercise, reps=reps)
-            if set_id:
-                set_ids.append(set_id)
+        # Sets are independent of each other, so they are created concurrently (in selection order)
+        reps = 10  # Default reps - could be made configurable
+        with ThreadPoolExecutor(max_workers=REQUEST_WORKERS) as executor:
+            created = list(executor.map(lambda exercise: self.create_set(exercise, reps=reps), selected_exercises))
+        set_ids = [set_id for set_id in created if set_id]
         
         if not set_ids:
             print("❌ No sets were created. Cannot create workout.")
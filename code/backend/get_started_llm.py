@@ -17,15 +17,21 @@ Usage:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uuid
 import json
 import sys
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from openai import OpenAI
 
+# Sets created in parallel; matches the session's connection pool size
+SET_CREATION_WORKERS = 4
+
 
 class LLMWorkoutSetup:
     def __init__(self, api_base: str = "http://localhost:8000", openai_api_key: Optional[str] = None):
@@ -33,6 +39,16 @@ class LLMWorkoutSetup:
         self.user_id = None
         self.created_sets = {}
         self.created_workouts = {}
+        self.known_exercise_ids = set()  # Exercises confirmed to exist in the API
+        
+        # One session for all API calls, so they reuse a keep-alive connection.
+        # Connection failures and 502/503/504 on reads are retried with backoff; POSTs are
+        # only retried when the connection could not be made, as they create data.
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SET_CREATION_WORKERS, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.exercises_cache = []  # Cache exercises to avoid multiple API calls
         
         # Initialize OpenAI client
@@ -47,7 +63,7 @@ class LLMWorkoutSetup:
             user_id = str(uuid.uuid4())
         
         print(f"\n📝 Creating user with ID: {user_id}")
-        response = requests.post(f"{self.api_base}/users/{user_id}")
+        response = self.session.post(f"{self.api_base}/users/{user_id}")
         
         if response.status_code == 201 or response.status_code == 200:
             print(f"✅ User created successfully: {user_id}")
@@ -70,7 +86,7 @@ class LLMWorkoutSetup:
         print("\n🔍 Fetching available exercises from API...")
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.api_base}/exercises/",
                 params={"skip": 0, "limit": limit}
             )
@@ -78,6 +94,8 @@ class LLMWorkoutSetup:
             if response.status_code == 200:
                 exercises = response.json()
                 print(f"✅ Found {len(exercises)} exercise(s) from API")
+                # Exercises listed by the API exist, so creating their sets needs no extra check
+                self.known_exercise_ids.update(e.get('id') for e in exercises)
                 self.exercises_cache = exercises  # Cache the results
                 return exercises
             elif response.status_code == 500:
@@ -239,10 +257,18 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
             return None
     
     def check_exercise_exists(self, exercise_id: str) -> bool:
-        """Check if an exercise exists using GET /exercises/{exercise_id} endpoint."""
+        """
+        Check if an exercise exists using GET /exercises/{exercise_id} endpoint.
+        Exercises already seen in the API are not fetched again.
+        """
+        if exercise_id in self.known_exercise_ids:
+            return True
         try:
-            response = requests.get(f"{self.api_base}/exercises/{exercise_id}")
-            return response.status_code == 200
+            response = self.session.get(f"{self.api_base}/exercises/{exercise_id}")
+            if response.status_code == 200:
+                self.known_exercise_ids.add(exercise_id)
+                return True
+            return False
         except Exception:
             return False
     
@@ -275,7 +301,7 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
             set_data["duration_sec"] = duration_sec
         
         print(f"  Creating set for {exercise_name} (exercise_id: {exercise_id})...")
-        response = requests.post(f"{self.api_base}/sets/", json=set_data)
+        response = self.session.post(f"{self.api_base}/sets/", json=set_data)
         
         if response.status_code in [200, 201]:
             set_result = response.json()
@@ -299,7 +325,45 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
         for exercise in self.get_exercises(limit=500, use_cache=True):
             exercises_map[exercise.get("id")] = exercise
         
-        # Create sets and build day plans
+        # Create the sets for every exercise in the plan up front. Each set is an exercise
+        # check plus a POST and none depend on each other, so they run concurrently.
+        pending_sets = {}
+        for day_plan_raw in day_plans_raw:
+            if not day_plan_raw.get("day"):
+                continue
+            for exercise_data in day_plan_raw.get("exercises", []):
+                exercise_id = exercise_data.get("exercise_id")
+                if exercise_id and exercise_id not in self.created_sets:
+                    pending_sets.setdefault(exercise_id, exercise_data)
+        
+        futures = {}
+        with ThreadPoolExecutor(max_workers=SET_CREATION_WORKERS) as executor:
+            for exercise_id, exercise_data in pending_sets.items():
+                exercise = exercises_map.get(exercise_id)
+                if exercise:
+                    exercise_name = exercise.get("name", exercise_id)
+                else:
+                    exercise_name = exercise_id
+                    print(f"  ⚠️  Exercise ID '{exercise_id}' not found in available exercises, using ID as name")
+                
+                futures[exercise_id] = executor.submit(
+                    self.create_set,
+                    exercise_id=exercise_id,
+                    exercise_name=exercise_name,
+                    reps=exercise_data.get("reps"),
+                    weight=exercise_data.get("weight"),
+                    duration_sec=exercise_data.get("duration_sec")
+                )
+        
+        # create_set reports rejected requests itself; surface anything it raised
+        # (connection errors after retries, unreadable responses) here
+        for exercise_id, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"    ❌ Failed to create set for exercise '{exercise_id}': {e}")
+        
+        # Build day plans from the created sets
         day_plans = []
         all_set_ids = []
         
@@ -318,33 +382,8 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
                     print(f"  ⚠️  Skipping exercise with no ID in {day}")
                     continue
                 
-                # Get exercise name
-                exercise = exercises_map.get(exercise_id)
-                if exercise:
-                    exercise_name = exercise.get("name", exercise_id)
-                else:
-                    exercise_name = exercise_id
-                    print(f"  ⚠️  Exercise ID '{exercise_id}' not found in available exercises, using ID as name")
-                
-                # Extract set parameters
-                reps = exercise_data.get("reps")
-                weight = exercise_data.get("weight")
-                duration_sec = exercise_data.get("duration_sec")
-                
-                # Check if set already created for this exercise_id
-                if exercise_id in self.created_sets:
-                    set_id = self.created_sets[exercise_id]
-                    print(f"  Reusing existing set for {exercise_name}")
-                else:
-                    # Create new set
-                    set_id = self.create_set(
-                        exercise_id=exercise_id,
-                        exercise_name=exercise_name,
-                        reps=reps,
-                        weight=weight,
-                        duration_sec=duration_sec
-                    )
-                
+                # Sets that failed to be created were already reported above
+                set_id = self.created_sets.get(exercise_id)
                 if set_id:
                     day_set_ids.append(set_id)
             
@@ -366,7 +405,7 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
             "workout_plan": day_plans
         }
         
-        response = requests.post(f"{self.api_base}/workouts/", json=workout_data)
+        response = self.session.post(f"{self.api_base}/workouts/", json=workout_data)
         
         if response.status_code in [200, 201]:
             result = response.json()
@@ -389,7 +428,7 @@ Create a personalized workout plan. Return ONLY valid JSON, no additional text."
             return False
         
         print(f"  Associating workout {workout_id} with user {self.user_id}...")
-        response = requests.post(
+        response = self.session.post(
             f"{self.api_base}/users/{self.user_id}/workouts/{workout_id}"
         )
         
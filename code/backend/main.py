@@ -1,11 +1,14 @@
 """FastAPI application entry point."""
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 import logging
+import os
 
 # Import database connection
-from database import connect_to_mongodb, db as database_db, client as database_client
+from database import connect_to_mongodb, ensure_indexes, db as database_db, client as database_client
 import database
+from workout_cache import ensure_cache_indexes
 
 # Import routers
 from routers.users import router as users_router
@@ -13,6 +16,7 @@ from routers.workouts import router as workouts_router
 from routers.sets import router as sets_router
 from routers.exercises import router as exercises_router
 from routers.history import router as history_router
+from routers.testing import router as testing_router
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +41,10 @@ async def lifespan(app: FastAPI):
     database.db = db
     database.client = client
     
+    # Secondary indexes for history/sets queries and the generated workout cache
+    ensure_indexes(db)
+    ensure_cache_indexes(db)
+    
     logger.info("Application startup complete. MongoDB connection established.")
     
     yield
@@ -75,6 +83,7 @@ app = FastAPI(
     """,
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json"
@@ -87,6 +96,11 @@ app.include_router(sets_router)
 app.include_router(exercises_router)
 app.include_router(history_router)
 
+# Endpoints that drive user state for tests and demos; never enabled in production
+if os.getenv("ENABLE_TESTING_ENDPOINTS"):
+    logger.warning("ENABLE_TESTING_ENDPOINTS is set - including the /testing router")
+    app.include_router(testing_router)
+
 
 @app.get("/")
 async def root():
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+One-time migration of the sets collection to a single exercise reference field.
+
+Older set documents store the exercise reference under the misspelled
+'excersise_id' key (sometimes alongside 'exercise_id'). The API now only reads
+and writes 'exercise_id', so this script copies the legacy value over where
+needed and removes the misspelled key.
+
+Usage:
+  python migrate_set_exercise_ids.py            # Run the migration
+  python migrate_set_exercise_ids.py --dry-run  # Only count affected documents
+"""
+
+from pymongo import MongoClient
+import os
+import sys
+import argparse
+
+# Import connection settings from connect.py
+from connect import (
+    MONGODB_URI,
+    DATABASE_NAME,
+    CERTIFICATE_FILE,
+)
+
+COLLECTION_NAME = "sets"
+LEGACY_FIELD = "excersise_id"
+
+
+def migrate_sets(dry_run=False):
+    """Rename the legacy 'excersise_id' field to 'exercise_id' on all sets."""
+    if not os.path.exists(CERTIFICATE_FILE):
+        print(f"❌ Error: Certificate file '{CERTIFICATE_FILE}' not found.")
+        print(f"   Please ensure the certificate file is in: {os.getcwd()}")
+        return False
+
+    try:
+        print("🔌 Connecting to MongoDB Atlas...")
+        client = MongoClient(
+            MONGODB_URI,
+            tls=True,
+            tlsCertificateKeyFile=CERTIFICATE_FILE,
+            serverSelectionTimeoutMS=10000
+        )
+
+        client.admin.command('ping')
+        print(f"✅ Connected to MongoDB Atlas")
+
+        collection = client[DATABASE_NAME][COLLECTION_NAME]
+        legacy_filter = {LEGACY_FIELD: {"$exists": True}}
+
+        affected = collection.count_documents(legacy_filter)
+        print(f"📈 Sets with '{LEGACY_FIELD}': {affected}")
+
+        if dry_run or affected == 0:
+            client.close()
+            print("\n🔌 Connection closed.")
+            return True
+
+        # Pipeline update: keep an existing exercise_id, otherwise take the legacy value
+        result = collection.update_many(
+            legacy_filter,
+            [
+                {"$set": {"exercise_id": {"$ifNull": ["$exercise_id", f"${LEGACY_FIELD}"]}}},
+                {"$unset": LEGACY_FIELD}
+            ]
+        )
+        print(f"✅ Migrated {result.modified_count} set(s)")
+
+        client.close()
+        print("\n🔌 Connection closed.")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error migrating sets: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize set documents to use 'exercise_id'")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many documents would be migrated"
+    )
+
+    args = parser.parse_args()
+
+    success = migrate_sets(dry_run=args.dry_run)
+    sys.exit(0 if success else 1)
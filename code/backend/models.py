@@ -1,5 +1,5 @@
 """Pydantic models for request and response validation."""
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from pydantic import BaseModel, Field
 
 
@@ -119,6 +119,26 @@ class DayPlan(BaseModel):
         }
 
 
+class ExerciseRefLLM(BaseModel):
+    """Exercise reference in an AI-generated workout plan (structured output)."""
+    exercise_id: str = Field(..., description="Exact exercise ID from provided list")
+    reps: Optional[int] = Field(..., description="Number of repetitions")
+    weight: Optional[int] = Field(..., description="Weight in kg")
+    duration_sec: Optional[int] = Field(..., description="Duration in seconds")
+
+
+class DayPlanLLM(BaseModel):
+    """Single day of an AI-generated workout plan (structured output)."""
+    day: Literal["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"] = Field(..., description="Day of the week")
+    exercises: List[ExerciseRefLLM] = Field(..., min_length=3, description="MANDATORY: Must contain at least 3 exercises")
+
+
+class WorkoutPlanLLMOutput(BaseModel):
+    """AI-generated workout plan returned by the LLM via structured outputs."""
+    workout_name: str = Field(..., description="Descriptive name for the workout plan")
+    workout_plan: List[DayPlanLLM] = Field(..., description="Array of daily workout plans")
+
+
 class CreateWorkoutRequest(BaseModel):
     """Request model for creating a workout plan."""
     workout_plan: List[DayPlan] = Field(..., description="Array of day plans, each with day and exercises_ids")
@@ -190,3 +210,25 @@ class CompleteSetRequest(BaseModel):
                 "set_id": "set_123"
             }
         }
+
+
+class SetProgressOperation(BaseModel):
+    """Progress update and optional completion for one set, applied together with others in a single update."""
+    set_id: str = Field(..., description="ID of the set to update", example="set_123")
+    completed_reps: Optional[int] = Field(None, description="Number of reps completed", example=12)
+    completed_duration_sec: Optional[int] = Field(None, description="Duration completed in seconds", example=45)
+    complete: bool = Field(False, description="Whether to also mark the set as complete", example=True)
+
+
+class SimulateDaysRequest(BaseModel):
+    """Request model for simulating a user working through several days of their plan."""
+    days: int = Field(..., description="Number of days to complete", example=4, ge=1, le=100)
+    rep_ratio: float = Field(0.7, description="Fraction of each set's target reps to record", example=0.7, gt=0, le=1)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "days": 4,
+                "rep_ratio": 0.7
+            }
+        }
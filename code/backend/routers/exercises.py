@@ -1,9 +1,10 @@
 """Exercise-related API endpoints."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import Dict, Any, List
 import logging
 from models import CreateExerciseRequest
 from database import get_database
+from pymongo.database import Database
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +12,7 @@ router = APIRouter(prefix="/exercises", tags=["Exercises"])
 
 
 @router.post("/", response_model=Dict[str, Any])
-async def create_exercise(request: CreateExerciseRequest):
+async def create_exercise(request: CreateExerciseRequest, db: Database = Depends(get_database)):
     """
     Create a new exercise.
     
@@ -30,11 +31,6 @@ async def create_exercise(request: CreateExerciseRequest):
     """
     logger.info(f"POST /exercises/ endpoint called with exercise_id: '{request.exercise_id}'")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot create exercise")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         exercises_collection = db["exercises"]
         
@@ -102,7 +98,7 @@ async def create_exercise(request: CreateExerciseRequest):
 
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_exercises(skip: int = 0, limit: int = 100):
+async def get_all_exercises(skip: int = 0, limit: int = 100, db: Database = Depends(get_database)):
     """
     Get all exercises with pagination support.
     
@@ -113,11 +109,6 @@ async def get_all_exercises(skip: int = 0, limit: int = 100):
     """
     logger.info(f"GET /exercises/ endpoint called (skip={skip}, limit={limit})")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get exercises")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     # Limit the maximum results to prevent performance issues
     limit = min(limit, 1000)
     
@@ -151,7 +142,7 @@ async def get_all_exercises(skip: int = 0, limit: int = 100):
 
 
 @router.get("/{exercise_id}", response_model=Dict[str, Any])
-async def get_exercise(exercise_id: str):
+async def get_exercise(exercise_id: str, db: Database = Depends(get_database)):
     """
     Get exercise information by exercise_id.
     
@@ -161,11 +152,6 @@ async def get_exercise(exercise_id: str):
     """
     logger.info(f"GET /exercises/{exercise_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get exercise")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         exercises_collection = db["exercises"]
         
@@ -198,7 +184,7 @@ async def get_exercise(exercise_id: str):
 
 
 @router.delete("/{exercise_id}", response_model=Dict[str, Any])
-async def delete_exercise(exercise_id: str):
+async def delete_exercise(exercise_id: str, db: Database = Depends(get_database)):
     """
     Delete an exercise by exercise_id.
     
@@ -208,11 +194,6 @@ async def delete_exercise(exercise_id: str):
     """
     logger.info(f"DELETE /exercises/{exercise_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot delete exercise")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         exercises_collection = db["exercises"]
         
@@ -227,12 +208,7 @@ async def delete_exercise(exercise_id: str):
         
         # Check if exercise is referenced by any sets
         sets_collection = db["sets"]
-        sets_using_exercise = sets_collection.count_documents({
-            '$or': [
-                {'exercise_id': exercise_id},
-                {'excersise_id': exercise_id}  # Also check typo version
-            ]
-        })
+        sets_using_exercise = sets_collection.count_documents({'exercise_id': exercise_id})
         
         if sets_using_exercise > 0:
             logger.warning(f"Cannot delete exercise '{exercise_id}': it is referenced by {sets_using_exercise} set(s)")
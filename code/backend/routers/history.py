@@ -1,9 +1,13 @@
 """History-related API endpoints for tracking workout completion progress."""
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
 import logging
-from models import UpdateSetProgressRequest, CompleteSetRequest
+from models import UpdateSetProgressRequest, CompleteSetRequest, SetProgressOperation
 from database import get_database
+from pymongo.database import Database
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 from datetime import datetime
 
@@ -11,6 +15,15 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/history", tags=["History"])
 
+# Fields read back after a set update: enough to tell whether the day is complete and
+# to start the next one, without returning every set's details
+_DAY_STATUS_FIELDS = {'workout_id': 1, 'current_day_index': 1, 'day_name': 1, 'sets_progress.is_complete': 1}
+# Fields needed for the latest history without the set details (include_sets=false)
+_LATEST_SUMMARY_FIELDS = {
+    'user_id': 1, 'workout_id': 1, 'current_day_index': 1, 'day_name': 1,
+    'sets_progress.is_complete': 1, 'created_at': 1, 'updated_at': 1
+}
+
 
 @router.get("/health")
 async def health_check():
@@ -18,6 +31,26 @@ async def health_check():
     return {"status": "ok", "router": "history"}
 
 
+def fetch_sets_and_exercises(db, set_ids: List[str]):
+    """
+    Fetch the given sets and the exercises they reference with one $in query per collection.
+
+    Returns (sets keyed by set id, exercises keyed by exercise id).
+    """
+    sets_by_id = {}
+    if set_ids:
+        for set_doc in db["sets"].find({'_id': {'$in': list(set(set_ids))}}):
+            sets_by_id[set_doc['_id']] = set_doc
+    
+    exercise_ids = {set_doc.get('exercise_id') for set_doc in sets_by_id.values() if set_doc.get('exercise_id')}
+    exercises_by_id = {}
+    if exercise_ids:
+        for exercise_doc in db["exercises"].find({'_id': {'$in': list(exercise_ids)}}):
+            exercises_by_id[exercise_doc['_id']] = exercise_doc
+    
+    return sets_by_id, exercises_by_id
+
+
 def create_initial_history_entry(user_id: str, workout_id: str, db):
     """
     Create the initial history entry for a user's workout.
@@ -26,7 +59,7 @@ def create_initial_history_entry(user_id: str, workout_id: str, db):
     logger.info(f"Creating initial history entry for user {user_id}, workout {workout_id}")
     
     workouts_collection = db["workouts"]
-    workout_doc = workouts_collection.find_one({'_id': workout_id})
+    workout_doc = workouts_collection.find_one({'_id': workout_id}, {'workout_plan': 1})
     
     if not workout_doc:
         logger.error(f"Workout '{workout_id}' not found")
@@ -46,20 +79,18 @@ def create_initial_history_entry(user_id: str, workout_id: str, db):
     
     # Get set details to create progress tracking
     # This derives from the sets structure as defined in code/backend/routers/sets.py
-    sets_collection = db["sets"]
-    exercises_collection = db["exercises"]
+    sets_by_id, exercises_by_id = fetch_sets_and_exercises(db, set_ids)
     sets_progress = []
     
     for set_id in set_ids:
-        set_doc = sets_collection.find_one({'_id': set_id})
+        set_doc = sets_by_id.get(set_id)
         if set_doc:
-            # Get exercise_id from set (handles both 'exercise_id' and 'excersise_id' typo)
-            exercise_id = set_doc.get('exercise_id') or set_doc.get('excersise_id')
+            exercise_id = set_doc.get('exercise_id')
             
-            # Fetch exercise details from code/backend/routers/exercises.py structure
+            # Exercise details from code/backend/routers/exercises.py structure
             exercise_doc = None
             if exercise_id:
-                exercise_doc = exercises_collection.find_one({'_id': exercise_id})
+                exercise_doc = exercises_by_id.get(exercise_id)
                 if not exercise_doc:
                     logger.warning(f"Exercise '{exercise_id}' referenced by set '{set_id}' not found")
             else:
@@ -114,21 +145,18 @@ def create_initial_history_entry(user_id: str, workout_id: str, db):
 
 
 @router.get("/{user_id}/latest", response_model=Dict[str, Any])
-async def get_latest_history(user_id: str):
+async def get_latest_history(user_id: str, include_sets: bool = True, db: Database = Depends(get_database)):
     """
     Get the latest workout history for a user.
     
     - **user_id**: ID of the user
+    - **include_sets**: Whether to include the sets with their set and exercise details (default: true).
+      Pass false when only the current day and progress are needed.
     
     Returns the current day's workout progress including all sets and their completion status.
     If no history exists, creates an initial history entry from the user's first workout.
     """
-    logger.info(f"GET /history/{user_id}/latest endpoint called")
-    
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get history")
-        raise HTTPException(status_code=500, detail="Database connection not available")
+    logger.info(f"GET /history/{user_id}/latest endpoint called (include_sets={include_sets})")
     
     try:
         history_collection = db["history"]
@@ -137,6 +165,7 @@ async def get_latest_history(user_id: str):
         logger.info(f"Searching for history for user {user_id}")
         history_doc = history_collection.find_one(
             {'user_id': user_id},
+            None if include_sets else _LATEST_SUMMARY_FIELDS,
             sort=[('created_at', -1)]
         )
         
@@ -166,36 +195,43 @@ async def get_latest_history(user_id: str):
             history_doc = create_initial_history_entry(user_id, workout_ids[0], db)
             logger.info(f"Successfully created history: {history_doc.get('_id')}")
         
-        # Enrich the response with set and exercise details
-        sets_collection = db["sets"]
-        exercises_collection = db["exercises"]
-        
-        enriched_sets = []
-        for set_progress in history_doc.get('sets_progress', []):
-            set_id = set_progress.get('set_id')
-            set_doc = sets_collection.find_one({'_id': set_id})
+        sets_progress = history_doc.get('sets_progress', [])
+        if include_sets:
+            # Enrich the response with set and exercise details
+            sets_by_id, exercises_by_id = fetch_sets_and_exercises(
+                db, [set_progress.get('set_id') for set_progress in sets_progress]
+            )
             
-            if set_doc:
-                exercise_id = set_doc.get('exercise_id') or set_doc.get('excersise_id')
-                exercise_doc = exercises_collection.find_one({'_id': exercise_id}) if exercise_id else None
+            enriched_sets = []
+            for set_progress in sets_progress:
+                set_id = set_progress.get('set_id')
+                set_doc = sets_by_id.get(set_id)
                 
-                enriched_set = {
-                    **set_progress,
-                    'set_name': set_doc.get('name'),
-                    'exercise_id': exercise_id,
-                    'exercise_name': exercise_doc.get('name') if exercise_doc else None,
-                    'exercise_details': {
-                        'category': exercise_doc.get('category'),
-                        'equipment': exercise_doc.get('equipment'),
-                        'primaryMuscles': exercise_doc.get('primaryMuscles'),
-                        'instructions': exercise_doc.get('instructions')
-                    } if exercise_doc else None
-                }
-                enriched_sets.append(enriched_set)
+                if set_doc:
+                    exercise_id = set_doc.get('exercise_id')
+                    exercise_doc = exercises_by_id.get(exercise_id) if exercise_id else None
+                    
+                    enriched_set = {
+                        **set_progress,
+                        'set_name': set_doc.get('name'),
+                        'exercise_id': exercise_id,
+                        'exercise_name': exercise_doc.get('name') if exercise_doc else None,
+                        'exercise_details': {
+                            'category': exercise_doc.get('category'),
+                            'equipment': exercise_doc.get('equipment'),
+                            'primaryMuscles': exercise_doc.get('primaryMuscles'),
+                            'instructions': exercise_doc.get('instructions')
+                        } if exercise_doc else None
+                    }
+                    enriched_sets.append(enriched_set)
+        else:
+            # Progress only: no set or exercise lookups
+            enriched_sets = None
         
-        # Calculate progress statistics
-        total_sets = len(enriched_sets)
-        completed_sets = sum(1 for s in enriched_sets if s.get('is_complete'))
+        # Calculate progress statistics from the stored progress, so they do not depend on include_sets
+        # and count the same sets as the day-complete check in POST /history/{user_id}/complete
+        total_sets = len(sets_progress)
+        completed_sets = sum(1 for s in sets_progress if s.get('is_complete'))
         
         response = {
             'history_id': history_doc.get('_id'),
@@ -213,6 +249,8 @@ async def get_latest_history(user_id: str):
             'created_at': history_doc.get('created_at'),
             'updated_at': history_doc.get('updated_at')
         }
+        if not include_sets:
+            del response['sets']
         
         logger.info(f"Retrieved history for user {user_id}: {history_doc.get('day_name')} - {completed_sets}/{total_sets} sets complete")
         return response
@@ -225,7 +263,7 @@ async def get_latest_history(user_id: str):
 
 
 @router.post("/{user_id}/update", response_model=Dict[str, Any])
-async def update_set_progress(user_id: str, request: UpdateSetProgressRequest):
+async def update_set_progress(user_id: str, request: UpdateSetProgressRequest, db: Database = Depends(get_database)):
     """
     Update progress on a specific set (e.g., number of reps completed).
     
@@ -238,54 +276,34 @@ async def update_set_progress(user_id: str, request: UpdateSetProgressRequest):
     """
     logger.info(f"POST /history/{user_id}/update endpoint called for set {request.set_id}")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot update history")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         history_collection = db["history"]
         
         # Get the latest history entry (sort by created_at to get the current active day)
         history_doc = history_collection.find_one(
             {'user_id': user_id},
+            {'_id': 1},
             sort=[('created_at', -1)]
         )
         
         if not history_doc:
             raise HTTPException(status_code=404, detail=f"No history found for user '{user_id}'")
         
-        # Find and update the specific set in sets_progress
-        sets_progress = history_doc.get('sets_progress', [])
-        set_found = False
-        
-        for set_progress in sets_progress:
-            if set_progress.get('set_id') == request.set_id:
-                set_found = True
-                if request.completed_reps is not None:
-                    set_progress['completed_reps'] = request.completed_reps
-                if request.completed_duration_sec is not None:
-                    set_progress['completed_duration_sec'] = request.completed_duration_sec
-                break
-        
-        if not set_found:
-            raise HTTPException(status_code=404, detail=f"Set '{request.set_id}' not found in current history")
-        
         now = datetime.utcnow().isoformat() + 'Z'
+        updates = {'updated_at': now}
+        if request.completed_reps is not None:
+            updates['sets_progress.$.completed_reps'] = request.completed_reps
+        if request.completed_duration_sec is not None:
+            updates['sets_progress.$.completed_duration_sec'] = request.completed_duration_sec
         
-        # Update the document
+        # Update only the matching array element, so concurrent updates to other sets are not overwritten
         result = history_collection.update_one(
-            {'_id': history_doc['_id']},
-            {
-                '$set': {
-                    'sets_progress': sets_progress,
-                    'updated_at': now
-                }
-            }
+            {'_id': history_doc['_id'], 'sets_progress.set_id': request.set_id},
+            {'$set': updates}
         )
         
-        if result.modified_count == 0:
-            logger.warning(f"Update did not modify document for user {user_id}")
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail=f"Set '{request.set_id}' not found in current history")
         
         logger.info(f"Updated set progress for set {request.set_id} in user {user_id}'s history")
         
@@ -303,8 +321,110 @@ async def update_set_progress(user_id: str, request: UpdateSetProgressRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update history: {str(e)}")
 
 
+def next_history_id(history_id: str) -> str:
+    """Deterministic _id of the history entry that follows history_id."""
+    return hashlib.sha256(f"{history_id}/next".encode("utf-8")).hexdigest()[:24]
+
+
+def start_next_day(db, history_doc: Dict[str, Any], user_id: str, now: str) -> Tuple[Optional[str], bool]:
+    """
+    Create the history entry for the day after the one in history_doc, looping back to
+    the first day at the end of the workout plan.
+
+    The next day's _id is derived from the finished day's, so requests completing the day's
+    last sets concurrently (e.g. every set of an exercise at once) cannot each start a new
+    day, and a request that fails halfway leaves nothing behind that blocks a retry.
+
+    Returns (name of the next day, whether this call started it). The name is None if the
+    workout no longer exists.
+    """
+    history_collection = db["history"]
+    new_history_id = next_history_id(history_doc['_id'])
+    
+    existing_doc = history_collection.find_one({'_id': new_history_id}, {'day_name': 1})
+    if existing_doc:
+        logger.info(f"Next day after history {history_doc['_id']} was already started for user {user_id}")
+        return existing_doc.get('day_name'), False
+    
+    logger.info(f"All sets complete for user {user_id}, moving to next day")
+    
+    # Get the workout to find the next day
+    workouts_collection = db["workouts"]
+    workout_id = history_doc.get('workout_id')
+    workout_doc = workouts_collection.find_one({'_id': workout_id}, {'workout_plan': 1})
+    
+    if workout_doc:
+        workout_plan = workout_doc.get('workout_plan', [])
+        current_day_index = history_doc.get('current_day_index', 0)
+        next_day_index = current_day_index + 1
+        
+        # Check if we need to loop back to the first day
+        if next_day_index >= len(workout_plan):
+            # Loop back to the first day of the workout plan
+            next_day_index = 0
+            logger.info(f"User {user_id} completed all days in the workout plan, looping back to first day")
+        
+        next_day = workout_plan[next_day_index]
+        day_name = next_day.get('day')
+        set_ids = next_day.get('exercises_ids', [])
+        
+        # Create progress tracking for the new day with full nested data
+        # This mirrors the logic in create_initial_history_entry
+        sets_by_id, exercises_by_id = fetch_sets_and_exercises(db, set_ids)
+        new_sets_progress = []
+        
+        for set_id in set_ids:
+            set_doc = sets_by_id.get(set_id)
+            if set_doc:
+                exercise_id = set_doc.get('exercise_id')
+                
+                # Exercise details
+                exercise_doc = None
+                if exercise_id:
+                    exercise_doc = exercises_by_id.get(exercise_id)
+                
+                # Create progress tracking entry with all relevant data
+                set_progress = {
+                    'set_id': set_id,
+                    'set_name': set_doc.get('name'),
+                    'exercise_id': exercise_id,
+                    'exercise_name': exercise_doc.get('name') if exercise_doc else None,
+                    'target_reps': set_doc.get('reps'),
+                    'completed_reps': 0,
+                    'target_weight': set_doc.get('weight'),
+                    'target_duration_sec': set_doc.get('duration_sec'),
+                    'is_complete': False,
+                    'completed_at': None
+                }
+                new_sets_progress.append(set_progress)
+        
+        # Create new history entry for the next day
+        new_history_doc = {
+            '_id': new_history_id,
+            'user_id': user_id,
+            'workout_id': workout_id,
+            'current_day_index': next_day_index,
+            'day_name': day_name,
+            'sets_progress': new_sets_progress,
+            'created_at': now,
+            'updated_at': now
+        }
+        
+        try:
+            history_collection.insert_one(new_history_doc)
+        except DuplicateKeyError:
+            # Another request inserted it between the check above and now
+            logger.info(f"Next day after history {history_doc['_id']} was already started for user {user_id}")
+            return day_name, False
+        
+        logger.info(f"Created new history entry for {day_name} (day {next_day_index + 1}) with {len(new_sets_progress)} sets")
+        return day_name, True
+    
+    return None, False
+
+
 @router.post("/{user_id}/complete", response_model=Dict[str, Any])
-async def complete_set(user_id: str, request: CompleteSetRequest):
+async def complete_set(user_id: str, request: CompleteSetRequest, db: Database = Depends(get_database)):
     """
     Mark a set as complete. When all sets in a day are complete, automatically
     creates a new history entry for the next day in the workout plan.
@@ -316,128 +436,48 @@ async def complete_set(user_id: str, request: CompleteSetRequest):
     """
     logger.info(f"POST /history/{user_id}/complete endpoint called for set {request.set_id}")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot complete set")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         history_collection = db["history"]
         
         # Get the latest history entry (sort by created_at to get the current active day)
         history_doc = history_collection.find_one(
             {'user_id': user_id},
+            {'_id': 1},
             sort=[('created_at', -1)]
         )
         
         if not history_doc:
             raise HTTPException(status_code=404, detail=f"No history found for user '{user_id}'")
         
-        # Find and mark the specific set as complete
-        sets_progress = history_doc.get('sets_progress', [])
-        set_found = False
-        
-        for set_progress in sets_progress:
-            if set_progress.get('set_id') == request.set_id:
-                set_found = True
-                set_progress['is_complete'] = True
-                set_progress['completed_at'] = datetime.utcnow().isoformat() + 'Z'
-                break
-        
-        if not set_found:
-            raise HTTPException(status_code=404, detail=f"Set '{request.set_id}' not found in current history")
-        
         now = datetime.utcnow().isoformat() + 'Z'
         
-        # Update the current document
-        history_collection.update_one(
-            {'_id': history_doc['_id']},
+        # Mark only the matching array element complete, so concurrent completions of other sets
+        # are not overwritten, and read back the whole day to check whether it is finished
+        history_doc = history_collection.find_one_and_update(
+            {'_id': history_doc['_id'], 'sets_progress.set_id': request.set_id},
             {
                 '$set': {
-                    'sets_progress': sets_progress,
+                    'sets_progress.$.is_complete': True,
+                    'sets_progress.$.completed_at': now,
                     'updated_at': now
                 }
-            }
+            },
+            projection=_DAY_STATUS_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
         
+        if history_doc is None:
+            raise HTTPException(status_code=404, detail=f"Set '{request.set_id}' not found in current history")
+        
+        sets_progress = history_doc.get('sets_progress', [])
+        
         # Check if all sets are complete
         all_complete = all(s.get('is_complete', False) for s in sets_progress)
         new_day_started = False
         new_day_name = None
         
         if all_complete:
-            logger.info(f"All sets complete for user {user_id}, moving to next day")
-            
-            # Get the workout to find the next day
-            workouts_collection = db["workouts"]
-            workout_id = history_doc.get('workout_id')
-            workout_doc = workouts_collection.find_one({'_id': workout_id})
-            
-            if workout_doc:
-                workout_plan = workout_doc.get('workout_plan', [])
-                current_day_index = history_doc.get('current_day_index', 0)
-                next_day_index = current_day_index + 1
-                
-                # Check if we need to loop back to the first day
-                if next_day_index >= len(workout_plan):
-                    # Loop back to the first day of the workout plan
-                    next_day_index = 0
-                    logger.info(f"User {user_id} completed all days in the workout plan, looping back to first day")
-                
-                next_day = workout_plan[next_day_index]
-                day_name = next_day.get('day')
-                set_ids = next_day.get('exercises_ids', [])
-                
-                # Create progress tracking for the new day with full nested data
-                # This mirrors the logic in create_initial_history_entry
-                sets_collection = db["sets"]
-                exercises_collection = db["exercises"]
-                new_sets_progress = []
-                
-                for set_id in set_ids:
-                    set_doc = sets_collection.find_one({'_id': set_id})
-                    if set_doc:
-                        # Get exercise_id from set (handles both 'exercise_id' and 'excersise_id' typo)
-                        exercise_id = set_doc.get('exercise_id') or set_doc.get('excersise_id')
-                        
-                        # Fetch exercise details
-                        exercise_doc = None
-                        if exercise_id:
-                            exercise_doc = exercises_collection.find_one({'_id': exercise_id})
-                        
-                        # Create progress tracking entry with all relevant data
-                        set_progress = {
-                            'set_id': set_id,
-                            'set_name': set_doc.get('name'),
-                            'exercise_id': exercise_id,
-                            'exercise_name': exercise_doc.get('name') if exercise_doc else None,
-                            'target_reps': set_doc.get('reps'),
-                            'completed_reps': 0,
-                            'target_weight': set_doc.get('weight'),
-                            'target_duration_sec': set_doc.get('duration_sec'),
-                            'is_complete': False,
-                            'completed_at': None
-                        }
-                        new_sets_progress.append(set_progress)
-                
-                # Create new history entry for the next day
-                new_history_id = str(ObjectId())
-                new_history_doc = {
-                    '_id': new_history_id,
-                    'user_id': user_id,
-                    'workout_id': workout_id,
-                    'current_day_index': next_day_index,
-                    'day_name': day_name,
-                    'sets_progress': new_sets_progress,
-                    'created_at': now,
-                    'updated_at': now
-                }
-                
-                history_collection.insert_one(new_history_doc)
-                new_day_started = True
-                new_day_name = day_name
-                
-                logger.info(f"Created new history entry for {day_name} (day {next_day_index + 1}) with {len(new_sets_progress)} sets")
+            new_day_name, new_day_started = start_next_day(db, history_doc, user_id, now)
         
         response = {
             'message': f"Set '{request.set_id}' marked as complete",
@@ -451,6 +491,10 @@ async def complete_set(user_id: str, request: CompleteSetRequest):
         if new_day_started:
             response['new_day_name'] = new_day_name
             response['message'] = f"Day complete! Started new day: {new_day_name}"
+        elif new_day_name is not None:
+            # Another request completing this day's last sets started the next day
+            response['current_day_name'] = new_day_name
+            response['message'] = f"Day complete; next day already started: {new_day_name}"
         elif all_complete:
             response['message'] = "Congratulations! You've completed the entire workout plan!"
         
@@ -462,3 +506,32 @@ async def complete_set(user_id: str, request: CompleteSetRequest):
     except Exception as e:
         logger.error(f"Error completing set for user '{user_id}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to complete set: {str(e)}")
+
+
+def apply_set_operations(db, history_id: str, ops: List[SetProgressOperation], now: str) -> Dict[str, Any]:
+    """
+    Apply set operations to a history entry in one atomic update, addressing each set
+    by its own array filter.
+
+    Returns the updated history document, limited to the _DAY_STATUS_FIELDS.
+    """
+    updates = {'updated_at': now}
+    array_filters = []
+    for idx, op in enumerate(ops):
+        element = f"sets_progress.$[s{idx}]"
+        if op.completed_reps is not None:
+            updates[f"{element}.completed_reps"] = op.completed_reps
+        if op.completed_duration_sec is not None:
+            updates[f"{element}.completed_duration_sec"] = op.completed_duration_sec
+        if op.complete:
+            updates[f"{element}.is_complete"] = True
+            updates[f"{element}.completed_at"] = now
+        array_filters.append({f"s{idx}.set_id": op.set_id})
+    
+    return db["history"].find_one_and_update(
+        {'_id': history_id},
+        {'$set': updates},
+        array_filters=array_filters,
+        projection=_DAY_STATUS_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
@@ -1,9 +1,10 @@
 """Set-related API endpoints."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import Dict, Any
 import logging
 from models import CreateSetRequest
 from database import get_database
+from pymongo.database import Database
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
@@ -12,7 +13,7 @@ router = APIRouter(prefix="/sets", tags=["Sets"])
 
 
 @router.post("/", response_model=Dict[str, Any])
-async def create_set(request: CreateSetRequest):
+async def create_set(request: CreateSetRequest, db: Database = Depends(get_database)):
     """
     Create a new set consisting of exercises.
     
@@ -26,11 +27,6 @@ async def create_set(request: CreateSetRequest):
     """
     logger.info(f"POST /sets/ endpoint called with name: '{request.name}'")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot create set")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         sets_collection = db["sets"]
         
@@ -41,8 +37,7 @@ async def create_set(request: CreateSetRequest):
         set_doc = {
             '_id': set_id,
             'name': request.name,
-            'excersise_id': request.exercise_id,  # Note: using typo to match existing data structure
-            'exercise_id': request.exercise_id,   # Also add correct spelling for future use
+            'exercise_id': request.exercise_id,
         }
         
         # Add optional fields if provided
@@ -80,7 +75,7 @@ async def create_set(request: CreateSetRequest):
 
 
 @router.get("/{set_id}", response_model=Dict[str, Any])
-async def get_set(set_id: str):
+async def get_set(set_id: str, db: Database = Depends(get_database)):
     """
     Get set information by set_id.
     
@@ -90,11 +85,6 @@ async def get_set(set_id: str):
     """
     logger.info(f"GET /sets/{set_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get set")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         sets_collection = db["sets"]
         
@@ -108,13 +98,11 @@ async def get_set(set_id: str):
                 detail=f"Set with set_id '{set_id}' not found"
             )
         
-        # Format response (handle both excersise_id (typo) and exercise_id (correct))
-        exercise_id = set_doc.get('exercise_id') or set_doc.get('excersise_id')
-        
+        # Format response
         set_data = {
             "id": set_doc.get('_id', set_id),
             "name": set_doc.get('name'),
-            "exercise_id": exercise_id,
+            "exercise_id": set_doc.get('exercise_id'),
             "reps": set_doc.get('reps'),
             "weight": set_doc.get('weight'),
             "duration_sec": set_doc.get('duration_sec')
@@ -131,7 +119,7 @@ async def get_set(set_id: str):
 
 
 @router.delete("/{set_id}", response_model=Dict[str, Any])
-async def delete_set(set_id: str):
+async def delete_set(set_id: str, db: Database = Depends(get_database)):
     """
     Delete a set by set_id.
     
@@ -141,35 +129,23 @@ async def delete_set(set_id: str):
     """
     logger.info(f"DELETE /sets/{set_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot delete set")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         sets_collection = db["sets"]
         
-        # Check if set exists
-        set_doc = sets_collection.find_one({'_id': set_id})
-        if not set_doc:
+        # Delete atomically; None means the set did not exist
+        set_doc = sets_collection.find_one_and_delete({'_id': set_id}, projection={'_id': 1})
+        if set_doc is None:
             logger.warning(f"Set with set_id '{set_id}' not found")
             raise HTTPException(
                 status_code=404,
                 detail=f"Set with set_id '{set_id}' not found"
             )
         
-        # Delete set
-        result = sets_collection.delete_one({'_id': set_id})
-        
-        if result.deleted_count == 1:
-            logger.info(f"Successfully deleted set with set_id: {set_id}")
-            return {
-                "message": f"Set with set_id '{set_id}' has been successfully deleted",
-                "set_id": set_id
-            }
-        else:
-            logger.error(f"Failed to delete set '{set_id}'")
-            raise HTTPException(status_code=500, detail=f"Failed to delete set with set_id '{set_id}'")
+        logger.info(f"Successfully deleted set with set_id: {set_id}")
+        return {
+            "message": f"Set with set_id '{set_id}' has been successfully deleted",
+            "set_id": set_id
+        }
     
     except HTTPException:
         raise
@@ -0,0 +1,115 @@
+"""
+Testing-only API endpoints that drive a user's state for test and demo setups.
+
+This router is only included when the ENABLE_TESTING_ENDPOINTS environment variable is set
+(see main.py), so it is never exposed by a production deployment.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any
+import logging
+from models import SetProgressOperation, SimulateDaysRequest
+from database import get_database
+from pymongo.database import Database
+from datetime import datetime
+from routers.history import apply_set_operations, start_next_day
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/testing", tags=["Testing"])
+
+
+# A plain def: FastAPI runs it in its threadpool, so the blocking per-day database calls
+# do not hold up the event loop
+@router.post("/{user_id}/simulate", response_model=Dict[str, Any])
+def simulate_days(user_id: str, request: SimulateDaysRequest, db: Database = Depends(get_database)):
+    """
+    Simulate the user working through the next days of their workout plan. Each day's
+    remaining sets are completed with a share of their target reps, then the next day is
+    started as in POST /history/{user_id}/complete.
+    
+    - **user_id**: ID of the user
+    - **days**: Number of days to complete
+    - **rep_ratio**: Fraction of each set's target reps to record (default: 0.7)
+    
+    Returns a summary of every simulated day and the day the user ends up on.
+    """
+    logger.info(f"POST /testing/{user_id}/simulate endpoint called for {request.days} day(s)")
+    
+    try:
+        history_collection = db["history"]
+        simulated_days = []
+        
+        for _ in range(request.days):
+            # Get the latest history entry (sort by created_at to get the current active day)
+            history_doc = history_collection.find_one(
+                {'user_id': user_id},
+                {'workout_id': 1, 'current_day_index': 1, 'day_name': 1, 'sets_progress': 1},
+                sort=[('created_at', -1)]
+            )
+            
+            if not history_doc:
+                raise HTTPException(status_code=404, detail=f"No history found for user '{user_id}'")
+            
+            sets_progress = history_doc.get('sets_progress', [])
+            if not sets_progress:
+                logger.warning(f"Day '{history_doc.get('day_name')}' has no sets, stopping simulation for user {user_id}")
+                break
+            
+            now = datetime.utcnow().isoformat() + 'Z'
+            
+            # One operation per set id: a day can list the same set more than once, the array filter
+            # of one operation already updates every entry of that set, and two filters matching the
+            # same element would make MongoDB reject the update
+            ops_by_set_id = {}
+            sets_completed = 0
+            for set_progress in sets_progress:
+                if set_progress.get('is_complete'):
+                    continue
+                sets_completed += 1
+                set_id = set_progress.get('set_id')
+                if set_id in ops_by_set_id:
+                    continue
+                target_reps = set_progress.get('target_reps')
+                ops_by_set_id[set_id] = SetProgressOperation(
+                    set_id=set_id,
+                    completed_reps=int(target_reps * request.rep_ratio) if target_reps else None,
+                    complete=True
+                )
+            ops = list(ops_by_set_id.values())
+            
+            if ops:
+                history_doc = apply_set_operations(db, history_doc['_id'], ops, now)
+            
+            new_day_name, _ = start_next_day(db, history_doc, user_id, now)
+            simulated_days.append({
+                'history_id': history_doc['_id'],
+                'day_index': history_doc.get('current_day_index'),
+                'day_name': history_doc.get('day_name'),
+                'total_sets': len(sets_progress),
+                'sets_completed': sets_completed,
+                'new_day_name': new_day_name
+            })
+            
+            if new_day_name is None:
+                break
+        
+        latest_doc = history_collection.find_one(
+            {'user_id': user_id},
+            {'current_day_index': 1, 'day_name': 1},
+            sort=[('created_at', -1)]
+        )
+        
+        logger.info(f"Simulated {len(simulated_days)} day(s) for user {user_id}")
+        return {
+            'message': f"Simulated {len(simulated_days)} day(s)",
+            'days_simulated': len(simulated_days),
+            'days': simulated_days,
+            'current_day_index': latest_doc.get('current_day_index') if latest_doc else None,
+            'current_day_name': latest_doc.get('day_name') if latest_doc else None
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error simulating days for user '{user_id}': {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to simulate days: {str(e)}")
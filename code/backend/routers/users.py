@@ -1,15 +1,33 @@
 """User-related API endpoints."""
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, NamedTuple, Optional
+import anyio
+import asyncio
+import heapq
 import logging
 import sys
-from models import GenerateWorkoutRequest
+from models import GenerateWorkoutRequest, WorkoutPlanLLMOutput
 from database import get_database
+from pymongo.database import Database
+from workout_cache import (
+    lookup_cached_workout,
+    store_cached_workout,
+    prompt_version,
+    embed_prompt,
+    find_similar_user_workout,
+    RECENT_USER_WORKOUTS,
+)
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pydantic import ValidationError
 import os
-import json
+import orjson
+from functools import lru_cache
+import httpx
 from openai import OpenAI
 import random
+import re
 
 # Set up logger to ensure it outputs to console
 logger = logging.getLogger(__name__)
@@ -23,9 +41,50 @@ if logger.level == logging.NOTSET:
 SEARCH_INDEX_NAME = "exercises_prod"
 SEARCH_PATHS = ["name", "instructions", "primaryMuscles", "secondaryMuscles", "equipment", "category"]
 
+# Static aggregation stages shared by every search pipeline (only $search and $limit vary per call)
+_FUZZY = {"maxEdits": 2, "prefixLength": 2}
+# Only the fields that end up in the LLM exercise summaries are returned
+_SUMMARY_FIELDS = {
+    "_id": 1,
+    "name": 1,
+    "category": 1,
+    "equipment": 1,
+    "primaryMuscles": 1,
+    "level": 1,
+}
+_PROJECT_STAGE = {
+    "$project": {
+        **_SUMMARY_FIELDS,
+        "score": {"$meta": "searchScore"}
+    }
+}
+_SORT_STAGE = {"$sort": {"score": -1}}
+
+# Shared HTTP/2 connection pool for all OpenAI clients, so requests reuse TCP/TLS connections
+_OPENAI_HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+)
+
+# System prompt for workout generation, read once at import time (restart the server after editing prompt.txt)
+_PROMPT_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompt.txt')
+try:
+    with open(_PROMPT_FILE, 'r', encoding='utf-8') as _f:
+        SYSTEM_PROMPT = _f.read()
+    SYSTEM_PROMPT_VERSION = prompt_version(SYSTEM_PROMPT)
+except FileNotFoundError:
+    SYSTEM_PROMPT = None
+    SYSTEM_PROMPT_VERSION = None
+
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
+@lru_cache(maxsize=8)
+def get_openai_client(api_key: str) -> OpenAI:
+    """Return a cached OpenAI client for the given API key, backed by the shared connection pool."""
+    return OpenAI(api_key=api_key, http_client=_OPENAI_HTTP_CLIENT)
+
+
 async def generate_search_keywords(prompt: str, openai_client) -> str:
     """Generate search keywords from user prompt using LLM."""
     logger.info(f"Starting LLM keyword generation for prompt: {prompt[:100]}...")
@@ -42,7 +101,9 @@ Return ONLY a space-separated string of keywords, no additional text or explanat
 Example output: "push ups chest strength bodyweight upper body" """
 
         logger.info("Calling OpenAI API for keyword generation...")
-        response = openai_client.chat.completions.create(
+        # Run the blocking client call in a worker thread so other tasks can progress meanwhile
+        response = await asyncio.to_thread(
+            openai_client.chat.completions.create,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a fitness search assistant. Generate concise, relevant search keywords."},
@@ -63,37 +124,21 @@ Example output: "push ups chest strength bodyweight upper body" """
 
 def search_exercises_all_fields(collection, query_text: str, limit: int = 100):
     """Search exercises across all fields using MongoDB Atlas Search."""
-    logger.debug(f"🔍 Executing search_all_fields with query: '{query_text}', limit: {limit}")
+    logger.debug("🔍 Executing search_all_fields with query: '%s', limit: %d", query_text, limit)
     try:
-        pipeline = [
-            {
-                "$search": {
-                    "index": SEARCH_INDEX_NAME,
-                    "text": {
-                        "query": query_text,
-                        "path": SEARCH_PATHS,
-                        "fuzzy": {"maxEdits": 2, "prefixLength": 2}
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "name": 1,
-                    "category": 1,
-                    "equipment": 1,
-                    "primaryMuscles": 1,
-                    "secondaryMuscles": 1,
-                    "level": 1,
-                    "instructions": 1,
-                    "score": {"$meta": "searchScore"}
+        search_stage = {
+            "$search": {
+                "index": SEARCH_INDEX_NAME,
+                "text": {
+                    "query": query_text,
+                    "path": SEARCH_PATHS,
+                    "fuzzy": _FUZZY
                 }
-            },
-            {"$sort": {"score": -1}},
-            {"$limit": limit}
-        ]
-        results = list(collection.aggregate(pipeline))
-        logger.debug(f"✅ search_all_fields returned {len(results)} results")
+            }
+        }
+        pipeline = [search_stage, _PROJECT_STAGE, _SORT_STAGE, {"$limit": limit}]
+        results = list(collection.aggregate(pipeline, batchSize=limit))
+        logger.debug("✅ search_all_fields returned %d results", len(results))
         return results
     except Exception as e:
         logger.error(f"❌ MongoDB search_all_fields failed: {e}", exc_info=True)
@@ -103,7 +148,7 @@ def search_exercises_all_fields(collection, query_text: str, limit: int = 100):
 
 def search_exercises_with_filters(collection, query_text: str, filters: Optional[Dict] = None, limit: int = 100):
     """Search exercises with filters (equipment, category, muscles, etc.)."""
-    logger.debug(f"🔍 Executing search_with_filters - query: '{query_text}', filters: {filters}, limit: {limit}")
+    logger.debug("🔍 Executing search_with_filters - query: '%s', filters: %s, limit: %d", query_text, filters, limit)
     try:
         must = []
         filter_clauses = []
@@ -113,7 +158,7 @@ def search_exercises_with_filters(collection, query_text: str, filters: Optional
                 "text": {
                     "query": query_text,
                     "path": SEARCH_PATHS,
-                    "fuzzy": {"maxEdits": 2, "prefixLength": 2}
+                    "fuzzy": _FUZZY
                 }
             })
 
@@ -138,31 +183,15 @@ def search_exercises_with_filters(collection, query_text: str, filters: Optional
         if not compound:
             return []
 
-        pipeline = [
-            {
-                "$search": {
-                    "index": SEARCH_INDEX_NAME,
-                    "compound": compound
-                }
-            },
-            {
-                "$project": {
-                    "_id": 1,
-                    "name": 1,
-                    "category": 1,
-                    "equipment": 1,
-                    "primaryMuscles": 1,
-                    "secondaryMuscles": 1,
-                    "level": 1,
-                    "instructions": 1,
-                    "score": {"$meta": "searchScore"}
-                }
-            },
-            {"$sort": {"score": -1}},
-            {"$limit": limit}
-        ]
-        results = list(collection.aggregate(pipeline))
-        logger.debug(f"✅ search_with_filters returned {len(results)} results")
+        search_stage = {
+            "$search": {
+                "index": SEARCH_INDEX_NAME,
+                "compound": compound
+            }
+        }
+        pipeline = [search_stage, _PROJECT_STAGE, _SORT_STAGE, {"$limit": limit}]
+        results = list(collection.aggregate(pipeline, batchSize=limit))
+        logger.debug("✅ search_with_filters returned %d results", len(results))
         return results
     except Exception as e:
         logger.error(f"❌ MongoDB search_with_filters failed: {e}", exc_info=True)
@@ -170,22 +199,93 @@ def search_exercises_with_filters(collection, query_text: str, filters: Optional
         return []
 
 
+# Vocabulary of the exercises collection, with common synonyms mapped onto the stored values.
+# Used to extract search filters from the prompt without an extra LLM round-trip.
+EQUIPMENT_VOCAB = {
+    "body only": "body only", "bodyweight": "body only", "body weight": "body only", "no equipment": "body only",
+    "dumbbell": "dumbbell", "dumbbells": "dumbbell",
+    "barbell": "barbell", "barbells": "barbell",
+    "kettlebell": "kettlebells", "kettlebells": "kettlebells",
+    "cable": "cable", "cables": "cable",
+    "machine": "machine", "machines": "machine",
+    "band": "bands", "bands": "bands", "resistance band": "bands", "resistance bands": "bands",
+    "medicine ball": "medicine ball",
+    "exercise ball": "exercise ball", "swiss ball": "exercise ball", "stability ball": "exercise ball",
+    "foam roll": "foam roll", "foam roller": "foam roll",
+    "e-z curl bar": "e-z curl bar", "ez bar": "e-z curl bar",
+}
+CATEGORY_VOCAB = {
+    "strength": "strength",
+    "stretch": "stretching", "stretching": "stretching", "flexibility": "stretching", "mobility": "stretching",
+    "yoga": "stretching",
+    "plyometric": "plyometrics", "plyometrics": "plyometrics",
+    "strongman": "strongman",
+    "powerlifting": "powerlifting",
+    "cardio": "cardio", "endurance": "cardio",
+    "olympic weightlifting": "olympic weightlifting", "olympic lifting": "olympic weightlifting",
+}
+MUSCLE_VOCAB = {
+    "abs": ["abdominals"], "abdominals": ["abdominals"], "core": ["abdominals"],
+    "abductors": ["abductors"], "adductors": ["adductors"],
+    "biceps": ["biceps"], "triceps": ["triceps"], "forearms": ["forearms"],
+    "arms": ["biceps", "triceps", "forearms"],
+    "calves": ["calves"], "glutes": ["glutes"], "hamstrings": ["hamstrings"], "quads": ["quadriceps"],
+    "quadriceps": ["quadriceps"], "legs": ["quadriceps", "hamstrings", "calves", "glutes"],
+    "chest": ["chest"], "pecs": ["chest"],
+    "lats": ["lats"], "lower back": ["lower back"], "middle back": ["middle back"],
+    "back": ["lats", "middle back", "lower back"],
+    "neck": ["neck"], "shoulders": ["shoulders"], "delts": ["shoulders"], "traps": ["traps"],
+}
+LEVEL_VOCAB = {
+    "beginner": "beginner", "novice": "beginner",
+    "intermediate": "intermediate",
+    "advanced": "expert", "expert": "expert",
+}
+
+
+def _match_vocab(text: str, vocab: Dict[str, Any]) -> List[Any]:
+    """Return the vocabulary values whose keys occur as whole words/phrases in text."""
+    padded = f" {' '.join(re.findall(r'[a-z0-9-]+', text.lower()))} "
+    return [value for term, value in vocab.items() if f" {term} " in padded]
+
+
+def extract_filters_from_prompt(prompt: str) -> Dict[str, Any]:
+    """Extract equipment, category, muscle groups and level from the prompt using fixed vocabularies."""
+    muscles = []
+    for values in _match_vocab(prompt, MUSCLE_VOCAB):
+        muscles.extend(m for m in values if m not in muscles)
+    levels = _match_vocab(prompt, LEVEL_VOCAB)
+    return {
+        "equipment": list(dict.fromkeys(_match_vocab(prompt, EQUIPMENT_VOCAB))),
+        "category": list(dict.fromkeys(_match_vocab(prompt, CATEGORY_VOCAB))),
+        "muscles": muscles,
+        "level": levels[0] if levels else None
+    }
+
+
+def append_workout_id_update(workout_id: str) -> List[Dict[str, Any]]:
+    """
+    Pipeline update appending workout_id to associated_workout_ids. Unlike $addToSet it also
+    works on user documents whose associated_workout_ids is still null (or missing).
+    Callers filter on {'associated_workout_ids': {'$ne': workout_id}} to avoid duplicates.
+    """
+    return [{'$set': {'associated_workout_ids': {'$concatArrays': [
+        {'$ifNull': ['$associated_workout_ids', []]},
+        [workout_id]
+    ]}}}]
+
+
 @router.post("/{user_id}", response_model=Dict[str, Any])
-async def create_user(user_id: str):
+async def create_user(user_id: str, db: Database = Depends(get_database)):
     """
     Create a new user.
     
     - **user_id**: Unique identifier for the user
     
-    Returns the created user data with associated_workout_ids set to null by default.
+    Returns the created user data with associated_workout_ids set to an empty list.
     """
     logger.info(f"POST /users/{user_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot create user")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         
@@ -225,7 +325,7 @@ async def create_user(user_id: str):
 
 
 @router.get("/{user_id}", response_model=Dict[str, Any])
-async def get_user(user_id: str):
+async def get_user(user_id: str, db: Database = Depends(get_database)):
     """
     Get user information by user_id.
     
@@ -235,11 +335,6 @@ async def get_user(user_id: str):
     """
     logger.info(f"GET /users/{user_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get user")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         user_doc = users_collection.find_one({'_id': user_id})
@@ -267,7 +362,7 @@ async def get_user(user_id: str):
 
 
 @router.delete("/{user_id}", response_model=Dict[str, Any])
-async def delete_user(user_id: str):
+async def delete_user(user_id: str, db: Database = Depends(get_database)):
     """
     Delete a user by user_id.
     
@@ -277,33 +372,23 @@ async def delete_user(user_id: str):
     """
     logger.info(f"DELETE /users/{user_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot delete user")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         
-        user_doc = users_collection.find_one({'_id': user_id})
-        if not user_doc:
+        # Delete atomically; None means the user did not exist
+        user_doc = users_collection.find_one_and_delete({'_id': user_id}, projection={'_id': 1})
+        if user_doc is None:
             logger.warning(f"User with user_id '{user_id}' not found")
             raise HTTPException(
                 status_code=404,
                 detail=f"User with user_id '{user_id}' not found"
             )
         
-        result = users_collection.delete_one({'_id': user_id})
-        
-        if result.deleted_count == 1:
-            logger.info(f"Successfully deleted user with user_id: {user_id}")
-            return {
-                "message": f"User with user_id '{user_id}' has been successfully deleted",
-                "user_id": user_id
-            }
-        else:
-            logger.error(f"Failed to delete user '{user_id}'")
-            raise HTTPException(status_code=500, detail=f"Failed to delete user with user_id '{user_id}'")
+        logger.info(f"Successfully deleted user with user_id: {user_id}")
+        return {
+            "message": f"User with user_id '{user_id}' has been successfully deleted",
+            "user_id": user_id
+        }
     
     except HTTPException:
         raise
@@ -313,7 +398,7 @@ async def delete_user(user_id: str):
 
 
 @router.post("/{user_id}/workouts/{workout_id}", response_model=Dict[str, Any], tags=["User Workouts"])
-async def add_workout_to_user(user_id: str, workout_id: str):
+async def add_workout_to_user(user_id: str, workout_id: str, db: Database = Depends(get_database)):
     """
     Add a workout ID to the user's associated_workout_ids list.
     
@@ -324,16 +409,16 @@ async def add_workout_to_user(user_id: str, workout_id: str):
     """
     logger.info(f"POST /users/{user_id}/workouts/{workout_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot add workout to user")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         workouts_collection = db["workouts"]
         
-        user_doc = users_collection.find_one({'_id': user_id})
+        # Existence checks are independent, so run both projection-only reads concurrently
+        user_doc, workout_doc = await asyncio.gather(
+            asyncio.to_thread(users_collection.find_one, {'_id': user_id}, {'_id': 1}),
+            asyncio.to_thread(workouts_collection.find_one, {'_id': workout_id}, {'_id': 1})
+        )
+        
         if not user_doc:
             logger.warning(f"User with user_id '{user_id}' not found")
             raise HTTPException(
@@ -341,7 +426,6 @@ async def add_workout_to_user(user_id: str, workout_id: str):
                 detail=f"User with user_id '{user_id}' not found"
             )
         
-        workout_doc = workouts_collection.find_one({'_id': workout_id})
         if not workout_doc:
             logger.warning(f"Workout with workout_id '{workout_id}' not found")
             raise HTTPException(
@@ -349,31 +433,30 @@ async def add_workout_to_user(user_id: str, workout_id: str):
                 detail=f"Workout with workout_id '{workout_id}' not found"
             )
         
-        current_workout_ids = user_doc.get('associated_workout_ids', [])
-        if current_workout_ids is None:
-            current_workout_ids = []
+        # Atomic append; the filter stops matching if the workout is already associated
+        updated_user = users_collection.find_one_and_update(
+            {'_id': user_id, 'associated_workout_ids': {'$ne': workout_id}},
+            append_workout_id_update(workout_id),
+            projection={'associated_workout_ids': 1},
+            return_document=ReturnDocument.AFTER
+        )
         
-        if workout_id in current_workout_ids:
+        if updated_user is None:
+            # No match: either the workout is already associated or the user was deleted meanwhile
+            if users_collection.find_one({'_id': user_id}, {'_id': 1}) is None:
+                logger.warning(f"User with user_id '{user_id}' not found")
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"User with user_id '{user_id}' not found"
+                )
             logger.warning(f"Workout '{workout_id}' is already associated with user '{user_id}'")
             raise HTTPException(
                 status_code=409,
                 detail=f"Workout with workout_id '{workout_id}' is already associated with user '{user_id}'"
             )
         
-        updated_workout_ids = current_workout_ids + [workout_id]
-        
-        result = users_collection.update_one(
-            {'_id': user_id},
-            {'$set': {'associated_workout_ids': updated_workout_ids}}
-        )
-        
-        if result.modified_count == 1:
-            logger.info(f"Successfully added workout '{workout_id}' to user '{user_id}'")
-        elif result.matched_count == 0:
-            logger.error(f"User '{user_id}' not found for update")
-            raise HTTPException(status_code=404, detail=f"User with user_id '{user_id}' not found")
-        else:
-            logger.warning(f"Update operation didn't modify user document")
+        updated_workout_ids = updated_user.get('associated_workout_ids') or []
+        logger.info(f"Successfully added workout '{workout_id}' to user '{user_id}'")
         
         return {
             "user_id": user_id,
@@ -389,7 +472,7 @@ async def add_workout_to_user(user_id: str, workout_id: str):
 
 
 @router.delete("/{user_id}/workouts/{workout_id}", response_model=Dict[str, Any], tags=["User Workouts"])
-async def remove_workout_from_user(user_id: str, workout_id: str):
+async def remove_workout_from_user(user_id: str, workout_id: str, db: Database = Depends(get_database)):
     """
     Remove a workout ID from the user's associated_workout_ids list.
     
@@ -400,47 +483,32 @@ async def remove_workout_from_user(user_id: str, workout_id: str):
     """
     logger.info(f"DELETE /users/{user_id}/workouts/{workout_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot remove workout from user")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         
-        user_doc = users_collection.find_one({'_id': user_id})
-        if not user_doc:
-            logger.warning(f"User with user_id '{user_id}' not found")
-            raise HTTPException(
-                status_code=404,
-                detail=f"User with user_id '{user_id}' not found"
-            )
-        
-        current_workout_ids = user_doc.get('associated_workout_ids', [])
-        if current_workout_ids is None:
-            current_workout_ids = []
+        # Pull the workout server-side; the filter only matches if it is currently associated
+        user_doc = users_collection.find_one_and_update(
+            {'_id': user_id, 'associated_workout_ids': workout_id},
+            {'$pull': {'associated_workout_ids': workout_id}},
+            projection={'associated_workout_ids': 1},
+            return_document=ReturnDocument.AFTER
+        )
         
-        if workout_id not in current_workout_ids:
+        if user_doc is None:
+            if users_collection.find_one({'_id': user_id}, {'_id': 1}) is None:
+                logger.warning(f"User with user_id '{user_id}' not found")
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"User with user_id '{user_id}' not found"
+                )
             logger.warning(f"Workout '{workout_id}' is not associated with user '{user_id}'")
             raise HTTPException(
                 status_code=404,
                 detail=f"Workout with workout_id '{workout_id}' is not associated with user '{user_id}'"
             )
         
-        updated_workout_ids = [wid for wid in current_workout_ids if wid != workout_id]
-        
-        result = users_collection.update_one(
-            {'_id': user_id},
-            {'$set': {'associated_workout_ids': updated_workout_ids}}
-        )
-        
-        if result.modified_count == 1:
-            logger.info(f"Successfully removed workout '{workout_id}' from user '{user_id}'")
-        elif result.matched_count == 0:
-            logger.error(f"User '{user_id}' not found for update")
-            raise HTTPException(status_code=404, detail=f"User with user_id '{user_id}' not found")
-        else:
-            logger.warning(f"Update operation didn't modify user document")
+        updated_workout_ids = user_doc.get('associated_workout_ids') or []
+        logger.info(f"Successfully removed workout '{workout_id}' from user '{user_id}'")
         
         return {
             "user_id": user_id,
@@ -456,7 +524,7 @@ async def remove_workout_from_user(user_id: str, workout_id: str):
 
 
 @router.get("/{user_id}/weekly-overview", response_model=Dict[str, Any], tags=["User Workouts"])
-async def get_weekly_overview(user_id: str):
+async def get_weekly_overview(user_id: str, db: Database = Depends(get_database)):
     """
     Get weekly workout overview for a specific user.
     
@@ -466,11 +534,6 @@ async def get_weekly_overview(user_id: str):
     """
     logger.info(f"GET /users/{user_id}/weekly-overview endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get weekly overview")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         users_collection = db["users"]
         user_doc = users_collection.find_one({'_id': user_id})
@@ -501,31 +564,33 @@ async def get_weekly_overview(user_id: str):
             set_ids = set()
             exercise_ids = set()
             
+            # Normalize set IDs to strings once per day and reuse for both lookups below
+            day_set_ids = []
             for day_plan in workout_plan:
-                exercises_ids = day_plan.get('exercises_ids', [])
-                exercises_ids = [str(eid) if not isinstance(eid, str) else eid for eid in exercises_ids]
+                exercises_ids = [eid if isinstance(eid, str) else str(eid) for eid in day_plan.get('exercises_ids', [])]
+                day_set_ids.append((day_plan.get('day', ''), exercises_ids))
                 set_ids.update(exercises_ids)
             
-            for set_id in set_ids:
-                set_doc = sets_collection.find_one({'_id': set_id})
-                if set_doc:
-                    formatted_set = {}
-                    for key, value in set_doc.items():
-                        if key != '_id':
-                            formatted_set[key] = value
-                    
-                    exercise_id = formatted_set.get('excersise_id') or formatted_set.get('exercise_id')
-                    if exercise_id:
-                        exercise_ids.add(exercise_id)
-                    
-                    all_sets[set_id] = formatted_set
+            # One $in query per collection instead of a find_one per set and per exercise
+            for set_doc in sets_collection.find({'_id': {'$in': list(set_ids)}}):
+                set_id = set_doc['_id']
+                formatted_set = {}
+                for key, value in set_doc.items():
+                    if key != '_id':
+                        formatted_set[key] = value
+                
+                exercise_id = formatted_set.get('exercise_id')
+                if exercise_id:
+                    exercise_ids.add(exercise_id)
+                
+                all_sets[set_id] = formatted_set
             
             exercises_collection = db["exercises"]
             all_exercises = {}
             
-            for exercise_id in exercise_ids:
-                exercise_doc = exercises_collection.find_one({'_id': exercise_id})
-                if exercise_doc:
+            if exercise_ids:
+                for exercise_doc in exercises_collection.find({'_id': {'$in': list(exercise_ids)}}):
+                    exercise_id = exercise_doc['_id']
                     formatted_exercise = {}
                     for key, value in exercise_doc.items():
                         if key == '_id':
@@ -539,11 +604,8 @@ async def get_weekly_overview(user_id: str):
             weekly_plan = []
             day_sets_map = {}
             
-            for day_plan in workout_plan:
-                day = day_plan.get('day', '')
-                exercises_ids = day_plan.get('exercises_ids', [])
-                exercises_ids = [str(eid) if not isinstance(eid, str) else eid for eid in exercises_ids]
-                day_sets_map[day] = [all_sets.get(str(eid)) for eid in exercises_ids if str(eid) in all_sets]
+            for day, exercises_ids in day_set_ids:
+                day_sets_map[day] = [all_sets[eid] for eid in exercises_ids if eid in all_sets]
             
             for day in week_days:
                 sets_for_day = day_sets_map.get(day, [])
@@ -551,7 +613,7 @@ async def get_weekly_overview(user_id: str):
                 formatted_sets = []
                 for set_data in sets_for_day:
                     if set_data:
-                        exercise_id = set_data.get('excersise_id') or set_data.get('exercise_id')
+                        exercise_id = set_data.get('exercise_id')
                         
                         exercise_info = None
                         if exercise_id and exercise_id in all_exercises:
@@ -590,7 +652,7 @@ async def get_weekly_overview(user_id: str):
         workouts_data = []
         
         for workout_id in associated_workout_ids:
-            workout_doc = workouts_collection.find_one({'_id': workout_id})
+            workout_doc = workouts_collection.find_one({'_id': workout_id}, {'workout_plan': 1})
             
             if not workout_doc:
                 logger.warning(f"Workout with workout_id '{workout_id}' not found - skipping")
@@ -642,455 +704,602 @@ async def get_weekly_overview(user_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get weekly overview: {str(e)}")
 
 
-@router.post("/{user_id}/generate-workout", response_model=Dict[str, Any], tags=["User Workouts"])
-async def generate_workout_for_user(user_id: str, request: GenerateWorkoutRequest):
+def _summarize_exercise(exercise_doc: Dict[str, Any], score: Optional[float]) -> Dict[str, Any]:
+    """Build the compact exercise summary that is shown to the LLM."""
+    return {
+        "id": str(exercise_doc.get('_id', '')),
+        "name": exercise_doc.get("name", ""),
+        "category": exercise_doc.get("category", ""),
+        "equipment": exercise_doc.get("equipment", ""),
+        "primaryMuscles": exercise_doc.get("primaryMuscles", []),
+        "level": exercise_doc.get("level", ""),
+        "score": round(score, 4) if score else None
+    }
+
+
+def existing_workout_response(user_id: str, workout_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the generate-workout response for an already existing workout of the user."""
+    workout_id = workout_doc['_id']
+    workout_name = workout_doc.get('workout_name', 'AI Generated Workout')
+    day_plans = workout_doc.get('workout_plan', [])
+    return {
+        "user_id": user_id,
+        "workout_id": workout_id,
+        "workout_name": workout_name,
+        "workout_plan": day_plans,
+        "summary": {
+            "sets_created": 0,
+            "days": len(day_plans),
+            "total_sets": sum(len(day_plan.get('exercises_ids', [])) for day_plan in day_plans)
+        },
+        "message": f"Found existing workout '{workout_name}' matching the prompt"
+    }
+
+
+class WorkoutGeneration(NamedTuple):
+    """What prepare_workout_generation found out before any exercise search or LLM call."""
+    openai_client: OpenAI
+    system_prompt: str
+    cache_version: str
+    # Cached plan for an identical or near-duplicate prompt, if any
+    workout_plan: Optional[WorkoutPlanLLMOutput]
+    prompt_embedding: Optional[List[float]]
+    # Set when the prompt closely matches one of the user's recent workouts; callers return it as-is
+    existing_response: Optional[Dict[str, Any]]
+
+
+def prepare_workout_generation(db, user_id: str, request: GenerateWorkoutRequest) -> WorkoutGeneration:
     """
-    Generate an AI-powered workout plan for an existing user.
+    Validate the user and API key, load the system prompt and check for a reusable workout.
+
+    Blocking (Mongo lookups and an embeddings request): call it with asyncio.to_thread.
+    """
+    users_collection = db["users"]
+    user_doc = users_collection.find_one(
+        {'_id': user_id},
+        {'_id': 1, 'associated_workout_ids': {'$slice': -RECENT_USER_WORKOUTS}}
+    )
     
-    - **user_id**: ID of the user (must already exist)
-    - **prompt**: Natural language description of the desired workout
-    - **openai_api_key**: (Optional) OpenAI API key
+    if not user_doc:
+        logger.warning(f"User with user_id '{user_id}' not found")
+        raise HTTPException(
+            status_code=404,
+            detail=f"User with user_id '{user_id}' not found. Please create the user first."
+        )
     
-    Returns the created workout with workout_id and summary.
-    """
-    print(f"[USERS.PY] POST /users/{user_id}/generate-workout endpoint called - Prompt: {request.prompt[:100]}...")
-    logger.info("="*80)
-    logger.info(f"🚀 POST /users/{user_id}/generate-workout endpoint called")
-    logger.info(f"📝 User prompt: {request.prompt}")
-    logger.info("="*80)
+    api_key = request.openai_api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("OpenAI API key not provided")
+        raise HTTPException(
+            status_code=400,
+            detail="OpenAI API key must be provided either in request or as OPENAI_API_KEY environment variable"
+        )
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot generate workout")
-        raise HTTPException(status_code=500, detail="Database connection not available")
+    openai_client = get_openai_client(api_key)
     
-    try:
-        users_collection = db["users"]
-        user_doc = users_collection.find_one({'_id': user_id})
-        
-        if not user_doc:
-            logger.warning(f"User with user_id '{user_id}' not found")
-            raise HTTPException(
-                status_code=404,
-                detail=f"User with user_id '{user_id}' not found. Please create the user first."
-            )
-        
-        api_key = request.openai_api_key or os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            logger.error("OpenAI API key not provided")
-            raise HTTPException(
-                status_code=400,
-                detail="OpenAI API key must be provided either in request or as OPENAI_API_KEY environment variable"
+    if SYSTEM_PROMPT is None:
+        logger.error(f"Prompt file not found at {_PROMPT_FILE}")
+        raise HTTPException(status_code=500, detail="Prompt file not found")
+    system_prompt = SYSTEM_PROMPT
+    
+    # Reuse one of the user's recent workouts when the prompt is nearly the same as the one that produced it
+    prompt_embedding = None
+    recent_workout_ids = user_doc.get('associated_workout_ids', [])
+    if recent_workout_ids:
+        recent_workouts = list(db["workouts"].find(
+            {'_id': {'$in': recent_workout_ids}, 'prompt_embedding': {'$exists': True}},
+            {'prompt_embedding': 1, 'workout_name': 1, 'workout_plan': 1}
+        ))
+        if recent_workouts:
+            try:
+                prompt_embedding = embed_prompt(request.prompt, openai_client)
+            except Exception as e:
+                logger.warning(f"Failed to embed prompt for user workout lookup: {e}")
+            if prompt_embedding is not None:
+                existing_workout = find_similar_user_workout(recent_workouts, prompt_embedding)
+                if existing_workout is not None:
+                    return WorkoutGeneration(
+                        openai_client, system_prompt, SYSTEM_PROMPT_VERSION, None, prompt_embedding,
+                        existing_workout_response(user_id, existing_workout)
+                    )
+    
+    # Return a cached plan for identical or near-duplicate prompts before any search or LLM work
+    cache_version = SYSTEM_PROMPT_VERSION
+    workout_plan_data, prompt_embedding = lookup_cached_workout(db, request.prompt, cache_version, openai_client, prompt_embedding)
+    workout_plan = None
+    if workout_plan_data is not None:
+        try:
+            workout_plan = WorkoutPlanLLMOutput.model_validate(workout_plan_data)
+        except ValidationError as e:
+            logger.warning(f"Ignoring cached workout plan that no longer matches the schema: {e}")
+    
+    return WorkoutGeneration(openai_client, system_prompt, cache_version, workout_plan, prompt_embedding, None)
+
+
+async def collect_candidate_exercises(prompt: str, openai_client, exercises_collection):
+    """
+    Find the exercises the LLM may choose from (steps 1-4 of workout generation).
+
+    Returns (exercise_summaries sorted by relevance, exercises_map of id -> exercise document).
+    """
+    # Generate search keywords using LLM
+    logger.info("="*60)
+    logger.info("STEP 1: Generating search keywords with LLM")
+    logger.info("="*60)
+    # Speculatively search with the raw prompt while the LLM generates keywords;
+    # the result is used as-is whenever keyword generation falls back to the prompt
+    keywords_task = asyncio.create_task(generate_search_keywords(prompt, openai_client))
+    speculative_search_task = asyncio.create_task(
+        asyncio.to_thread(search_exercises_all_fields, exercises_collection, prompt, 50)
+    )
+    # Filters only depend on the prompt, so the refined muscle search (Query 2) also
+    # runs while the keyword LLM call and the initial search are in flight
+    extraction_data = extract_filters_from_prompt(prompt)
+    refined_search_task = None
+    if extraction_data.get("muscles"):
+        muscle_query = ' '.join(extraction_data["muscles"])
+        refined_search_task = asyncio.create_task(
+            asyncio.to_thread(
+                search_exercises_with_filters,
+                exercises_collection,
+                muscle_query,
+                {"primaryMuscles": muscle_query},
+                150
             )
+        )
+    search_keywords = await keywords_task
+    logger.info(f"📝 Final search keywords to use: '{search_keywords}'")
+    
+    # Query 1: Initial search based on keywords
+    logger.info("="*60)
+    logger.info("STEP 2: Performing initial MongoDB Atlas search")
+    logger.info("="*60)
+    if search_keywords.strip().lower() == prompt.strip().lower():
+        logger.info("🔍 Keywords match the prompt - using speculative search results")
+        initial_results = await speculative_search_task
+    else:
+        speculative_search_task.cancel()
+        logger.info(f"🔍 Searching with keywords: '{search_keywords}' (limit: 50)")
+        initial_results = await asyncio.to_thread(search_exercises_all_fields, exercises_collection, search_keywords, 50)
+    logger.info(f"📊 Initial search returned {len(initial_results) if initial_results else 0} results")
+    
+    exercise_summaries = []
+    exercises_map = {}
+    
+    # If search fails or returns few results, fall back to regular query
+    if not initial_results or len(initial_results) < 10:
+        logger.warning(f"⚠️  Search returned {len(initial_results) if initial_results else 0} results (< 10), falling back to regular query")
+        logger.info("Fetching exercises using regular MongoDB query (limit: 300)...")
+        if refined_search_task is not None:
+            refined_search_task.cancel()
+        exercise_docs = list(exercises_collection.find({}, _SUMMARY_FIELDS).limit(300).batch_size(300))
+        logger.info(f"✅ Regular query found {len(exercise_docs)} exercises")
+        for exercise_doc in exercise_docs:
+            exercise_summaries.append(_summarize_exercise(exercise_doc, None))
+            exercises_map[str(exercise_doc.get('_id', ''))] = exercise_doc
+    else:
+        # Use search results, sorted by score (already sorted by search)
+        logger.info(f"✅ Search found {len(initial_results)} relevant exercises")
+        logger.info("Processing search results and extracting exercise data...")
         
-        openai_client = OpenAI(api_key=api_key)
-        
-        exercises_collection = db["exercises"]
+        if logger.isEnabledFor(logging.DEBUG):
+            for idx, exercise_doc in enumerate(initial_results[:5], 1):  # Log first 5 for debugging
+                logger.debug("  Result %d: %s (score: %.4f)", idx, exercise_doc.get('name'), exercise_doc.get('score', 0))
         
-        # Generate search keywords using LLM
-        logger.info("="*60)
-        logger.info("STEP 1: Generating search keywords with LLM")
-        logger.info("="*60)
-        search_keywords = await generate_search_keywords(request.prompt, openai_client)
-        logger.info(f"📝 Final search keywords to use: '{search_keywords}'")
+        for exercise_doc in initial_results:
+            exercise_summaries.append(_summarize_exercise(exercise_doc, exercise_doc.get('score', 0)))
+            exercises_map[str(exercise_doc.get('_id', ''))] = exercise_doc
         
-        # Query 1: Initial search based on keywords
+        # Query 2: Try to refine search with filters if we can detect them
+        # Equipment, category and muscle groups are matched locally against the exercise vocabulary
         logger.info("="*60)
-        logger.info("STEP 2: Performing initial MongoDB Atlas search")
+        logger.info("STEP 3: Extracting filters and performing refined search")
         logger.info("="*60)
-        logger.info(f"🔍 Searching with keywords: '{search_keywords}' (limit: 200)")
-        initial_results = search_exercises_all_fields(exercises_collection, search_keywords, limit=50)
-        logger.info(f"📊 Initial search returned {len(initial_results) if initial_results else 0} results")
-        
-        # If search fails or returns few results, fall back to regular query
-        if not initial_results or len(initial_results) < 10:
-            logger.warning(f"⚠️  Search returned {len(initial_results) if initial_results else 0} results (< 10), falling back to regular query")
-            logger.info("Fetching exercises using regular MongoDB query (limit: 300)...")
-            exercise_docs = list(exercises_collection.find().limit(300))
-            logger.info(f"✅ Regular query found {len(exercise_docs)} exercises")
-            exercise_summaries = []
-            exercises_map = {}
-            for exercise_doc in exercise_docs:
-                exercise_id = exercise_doc.get('_id', '')
-                exercise_summary = {
-                    "id": str(exercise_id),
-                    "name": exercise_doc.get("name", ""),
-                    "category": exercise_doc.get("category", ""),
-                    "equipment": exercise_doc.get("equipment", ""),
-                    "primaryMuscles": exercise_doc.get("primaryMuscles", []),
-                    "level": exercise_doc.get("level", ""),
-                    "score": None
-                }
-                exercise_summaries.append(exercise_summary)
-                exercises_map[str(exercise_id)] = exercise_doc
-        else:
-            # Use search results, sorted by score (already sorted by search)
-            logger.info(f"✅ Search found {len(initial_results)} relevant exercises")
-            logger.info("Processing search results and extracting exercise data...")
-            exercise_summaries = []
-            exercises_map = {}
+        try:
+            logger.info(f"✅ Extracted filters from prompt: {extraction_data}")
+            filters = {}
             
-            for idx, exercise_doc in enumerate(initial_results, 1):
-                if idx <= 5:  # Log first 5 for debugging
-                    logger.debug(f"  Result {idx}: {exercise_doc.get('name')} (score: {exercise_doc.get('score', 0):.4f})")
+            if extraction_data.get("equipment"):
+                filters["equipment"] = extraction_data["equipment"]
+            if extraction_data.get("category"):
+                filters["category"] = extraction_data["category"]
+            if refined_search_task is not None:
+                # Search in primary and secondary muscles (started concurrently in STEP 1)
+                logger.info(f"🔍 Awaiting refined search with muscle query: '{muscle_query}'")
+                refined_results = await refined_search_task
+                
+                if refined_results and len(refined_results) > 0:
+                    logger.info(f"✅ Refined search with muscle filters found {len(refined_results)} exercises")
+                    # Merge refined results with initial results, prioritizing by score
+                    refined_ids = {str(r.get('_id')): r for r in refined_results}
+                    # Update existing summaries with refined scores
+                    for summary in exercise_summaries:
+                        ex_id = summary["id"]
+                        if ex_id in refined_ids:
+                            refined_score = refined_ids[ex_id].get('score', 0)
+                            summary["score"] = round(refined_score, 4) if refined_score else summary.get("score")
+                    
+                    # Add new exercises from refined search
+                    for refined_doc in refined_results:
+                        ex_id = str(refined_doc.get('_id'))
+                        if ex_id not in exercises_map:
+                            exercise_summaries.append(_summarize_exercise(refined_doc, refined_doc.get('score', 0)))
+                            exercises_map[ex_id] = refined_doc
             
-            for exercise_doc in initial_results:
-                exercise_id = exercise_doc.get('_id', '')
-                score = exercise_doc.get('score', 0)
-                exercise_summary = {
-                    "id": str(exercise_id),
-                    "name": exercise_doc.get("name", ""),
-                    "category": exercise_doc.get("category", ""),
-                    "equipment": exercise_doc.get("equipment", ""),
-                    "primaryMuscles": exercise_doc.get("primaryMuscles", []),
-                    "level": exercise_doc.get("level", ""),
-                    "score": round(score, 4) if score else None
-                }
-                exercise_summaries.append(exercise_summary)
-                exercises_map[str(exercise_id)] = exercise_doc
+            # Re-sort by score if we have scores
+            logger.info("Re-sorting exercises by relevance score...")
+            # Keep the top 250 exercises, scored ones ahead of unscored
+            exercise_summaries = heapq.nlargest(
+                250,
+                exercise_summaries,
+                key=lambda x: (x.get("score") is not None, x.get("score") or 0)
+            )
+            logger.info(f"✅ Final exercise list contains {len(exercise_summaries)} exercises (sorted by score)")
             
-            # Query 2: Try to refine search with filters if we can detect them
-            # Use LLM to extract equipment, category, muscle groups from prompt
-            logger.info("="*60)
-            logger.info("STEP 3: Extracting filters and performing refined search")
-            logger.info("="*60)
-            try:
-                logger.info("Calling LLM to extract equipment, category, and muscle groups...")
-                extraction_prompt = f"""Extract the following information from this fitness goal: "{request.prompt}"
+        except Exception as e:
+            logger.error(f"❌ Failed to extract filters or perform refined search: {e}", exc_info=True)
+            logger.info("Continuing with initial search results only")
+            # Continue with initial results
+    
+    if not exercise_summaries:
+        logger.warning("No exercises found in database")
+        raise HTTPException(
+            status_code=404,
+            detail="No exercises found in database. Please upload exercises first."
+        )
+    
+    logger.info("="*60)
+    logger.info("STEP 4: Preparing exercises for workout generation")
+    logger.info("="*60)
+    logger.info(f"📋 Prepared {len(exercise_summaries)} exercises for LLM")
+    logger.info(f"   - Top {min(10, len(exercise_summaries))} exercise names: {[ex['name'] for ex in exercise_summaries[:10]]}")
+    
+    return exercise_summaries, exercises_map
 
-Return a JSON object with:
-- equipment: list of equipment mentioned (e.g., ["dumbbells", "body only"])
-- category: list of categories mentioned (e.g., ["strength", "cardio", "stretching"])
-- muscles: list of muscle groups mentioned (e.g., ["chest", "legs", "abs"])
-- level: user level if mentioned (e.g., "beginner", "intermediate", "advanced")
 
-If nothing is mentioned for a field, return an empty list or null. Return ONLY valid JSON."""
+def _intern(value: str, codes: Dict[str, str], prefix: str) -> str:
+    """Return the short code for a repeated string value, assigning the next free one if needed."""
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = f"{prefix}{len(codes)}"
+    return code
 
-                extraction_response = openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are a fitness data extraction assistant. Extract information from user queries and return only valid JSON."},
-                        {"role": "user", "content": extraction_prompt}
-                    ],
-                    temperature=0.2,
-                    response_format={"type": "json_object"}
-                )
-                
-                extraction_data = json.loads(extraction_response.choices[0].message.content)
-                logger.info(f"✅ LLM extracted filters: {json.dumps(extraction_data, indent=2)}")
-                filters = {}
-                
-                if extraction_data.get("equipment"):
-                    filters["equipment"] = extraction_data["equipment"]
-                if extraction_data.get("category"):
-                    filters["category"] = extraction_data["category"]
-                if extraction_data.get("muscles"):
-                    # Search in primary and secondary muscles
-                    muscle_query = ' '.join(extraction_data["muscles"])
-                    logger.info(f"🔍 Performing refined search with muscle query: '{muscle_query}'")
-                    refined_results = search_exercises_with_filters(
-                        exercises_collection, 
-                        muscle_query,
-                        {"primaryMuscles": muscle_query},
-                        limit=150
-                    )
-                    
-                    if refined_results and len(refined_results) > 0:
-                        logger.info(f"✅ Refined search with muscle filters found {len(refined_results)} exercises")
-                        # Merge refined results with initial results, prioritizing by score
-                        refined_ids = {str(r.get('_id')): r for r in refined_results}
-                        # Update existing summaries with refined scores
-                        for summary in exercise_summaries:
-                            ex_id = summary["id"]
-                            if ex_id in refined_ids:
-                                refined_score = refined_ids[ex_id].get('score', 0)
-                                summary["score"] = round(refined_score, 4) if refined_score else summary.get("score")
-                        
-                        # Add new exercises from refined search
-                        for refined_doc in refined_results:
-                            ex_id = str(refined_doc.get('_id'))
-                            if ex_id not in exercises_map:
-                                score = refined_doc.get('score', 0)
-                                exercise_summary = {
-                                    "id": ex_id,
-                                    "name": refined_doc.get("name", ""),
-                                    "category": refined_doc.get("category", ""),
-                                    "equipment": refined_doc.get("equipment", ""),
-                                    "primaryMuscles": refined_doc.get("primaryMuscles", []),
-                                    "level": refined_doc.get("level", ""),
-                                    "score": round(score, 4) if score else None
-                                }
-                                exercise_summaries.append(exercise_summary)
-                                exercises_map[ex_id] = refined_doc
-                
-                # Re-sort by score if we have scores
-                logger.info("Re-sorting exercises by relevance score...")
-                exercise_summaries.sort(key=lambda x: x.get("score") or 0, reverse=True)
-                # Limit to top 250 exercises with scores
-                exercise_summaries = [ex for ex in exercise_summaries if ex.get("score")] + [ex for ex in exercise_summaries if not ex.get("score")]
-                exercise_summaries = exercise_summaries[:250]
-                logger.info(f"✅ Final exercise list contains {len(exercise_summaries)} exercises (sorted by score)")
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to extract filters or perform refined search: {e}", exc_info=True)
-                logger.info("Continuing with initial search results only")
-                # Continue with initial results
-        
-        if not exercise_summaries:
-            logger.warning("No exercises found in database")
-            raise HTTPException(
-                status_code=404,
-                detail="No exercises found in database. Please upload exercises first."
-            )
-        
-        logger.info("="*60)
-        logger.info("STEP 4: Preparing exercises for workout generation")
-        logger.info("="*60)
-        logger.info(f"📋 Prepared {len(exercise_summaries)} exercises for LLM")
-        logger.info(f"   - Top {min(10, len(exercise_summaries))} exercise names: {[ex['name'] for ex in exercise_summaries[:10]]}")
-        
-        # Load system prompt from prompt.txt file
-        prompt_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'prompt.txt')
-        try:
-            with open(prompt_file_path, 'r', encoding='utf-8') as f:
-                system_prompt = f.read()
-        except FileNotFoundError:
-            logger.error(f"Prompt file not found at {prompt_file_path}")
-            raise HTTPException(status_code=500, detail="Prompt file not found")
-        except Exception as e:
-            logger.error(f"Error reading prompt file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error loading prompt file: {str(e)}")
 
-        user_message = f"""User's fitness goal: {request.prompt}
+def encode_exercise_rows(exercise_summaries: List[Dict[str, Any]]) -> str:
+    """
+    Encode exercise summaries for the LLM as a legend followed by one compact JSON object per line.
+
+    Repeated category, equipment, muscle and level values are replaced by short codes defined in the
+    legend; keys are shortened to id, n(ame), m(uscles), e(quipment), c(ategory), l(evel), s(core).
+    """
+    category_codes, equipment_codes, muscle_codes, level_codes = {}, {}, {}, {}
+    rows = []
+    for summary in exercise_summaries:
+        row = {"id": summary["id"], "n": summary["name"]}
+        if summary.get("primaryMuscles"):
+            row["m"] = [_intern(muscle, muscle_codes, "M") for muscle in summary["primaryMuscles"]]
+        if summary.get("equipment"):
+            row["e"] = _intern(summary["equipment"], equipment_codes, "E")
+        if summary.get("category"):
+            row["c"] = _intern(summary["category"], category_codes, "C")
+        if summary.get("level"):
+            row["l"] = _intern(summary["level"], level_codes, "L")
+        if summary.get("score") is not None:
+            row["s"] = summary["score"]
+        rows.append(orjson.dumps(row).decode())
+    
+    legend = "\n".join(
+        f"{title}: " + ", ".join(f"{code}={value}" for value, code in codes.items())
+        for title, codes in (
+            ("Categories", category_codes),
+            ("Equipment", equipment_codes),
+            ("Muscles", muscle_codes),
+            ("Levels", level_codes),
+        )
+        if codes
+    )
+    return f"{legend}\n\n" + "\n".join(rows)
 
-Available exercises (select from these only, sorted by relevance score - higher scores are more relevant):
-{json.dumps(exercise_summaries, indent=2)}
 
-Note: Exercises with higher "score" values are more relevant to the user's goal. Prioritize exercises with higher scores when creating the workout plan.
+def build_generation_messages(prompt: str, system_prompt: str, exercise_summaries: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Build the chat messages for the workout-generation call."""
+    user_message = f"""User's fitness goal: {prompt}
+
+Available exercises (select from these only, sorted by relevance score - higher scores are more relevant).
+Each line after the legend is one exercise: id = exercise_id, n = name, m = primary muscles, e = equipment, c = category, l = level, s = score. Codes are defined in the legend.
+{encode_exercise_rows(exercise_summaries)}
+
+Note: Exercises with higher "s" (score) values are more relevant to the user's goal. Prioritize exercises with higher scores when creating the workout plan.
 
 Create a personalized workout plan. Return ONLY valid JSON, no additional text."""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
 
-        # Define JSON schema for structured outputs
-        workout_schema = {
-            "name": "workout_plan_schema",
-            "description": "Schema for AI-generated workout plans with mandatory 3+ exercises per day",
-            "strict": True,
-            "schema": {
-                "type": "object",
-                "properties": {
-                    "workout_name": {
-                        "type": "string",
-                        "description": "Descriptive name for the workout plan"
-                    },
-                    "workout_plan": {
-                        "type": "array",
-                        "description": "Array of daily workout plans",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "day": {
-                                    "type": "string",
-                                    "enum": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
-                                    "description": "Day of the week"
-                                },
-                                "exercises": {
-                                    "type": "array",
-                                    "description": "MANDATORY: Must contain at least 3 exercises",
-                                    "minItems": 3,
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "exercise_id": {
-                                                "type": "string",
-                                                "description": "Exact exercise ID from provided list"
-                                            },
-                                            "reps": {
-                                                "type": ["integer", "null"],
-                                                "description": "Number of repetitions"
-                                            },
-                                            "weight": {
-                                                "type": ["integer", "null"],
-                                                "description": "Weight in kg"
-                                            },
-                                            "duration_sec": {
-                                                "type": ["integer", "null"],
-                                                "description": "Duration in seconds"
-                                            }
-                                        },
-                                        "required": ["exercise_id", "reps", "weight", "duration_sec"],
-                                        "additionalProperties": False
-                                    }
-                                }
-                            },
-                            "required": ["day", "exercises"],
-                            "additionalProperties": False
-                        }
-                    }
-                },
-                "required": ["workout_name", "workout_plan"],
-                "additionalProperties": False
-            }
-        }
-        
-        logger.info("="*60)
-        logger.info("STEP 5: Generating workout plan with LLM (using structured outputs)")
-        logger.info("="*60)
-        logger.info("Calling OpenAI API to generate workout plan with schema enforcement...")
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.7,
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": workout_schema
-                }
-            )
-            
-            content = response.choices[0].message.content
-            logger.info("✅ Successfully received workout plan response from OpenAI")
-            logger.debug(f"Response length: {len(content)} characters")
-            
-            workout_plan_data = json.loads(content)
-            logger.info(f"✅ Successfully parsed workout plan JSON")
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response from OpenAI: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to parse workout plan from OpenAI: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error calling OpenAI API: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to generate workout plan with OpenAI: {str(e)}")
-        
-        workout_name = workout_plan_data.get("workout_name", "AI Generated Workout")
-        day_plans_raw = workout_plan_data.get("workout_plan", [])
-        
-        logger.info(f"Processing workout plan: {workout_name} with {len(day_plans_raw)} days")
-        
-        sets_collection = db["sets"]
-        workouts_collection = db["workouts"]
-        day_plans = []
-        created_sets = {}
-        created_set_ids = []
+
+async def save_generated_workout(db, user_id: str, workout_plan: WorkoutPlanLLMOutput, exercises_map: Dict[str, Any], prompt_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    Create the sets and workout for a generated plan and associate the workout with the user.
+    The prompt embedding is stored on the workout so later, similar prompts of the user can reuse it.
+
+    Returns the response payload of the generate-workout endpoint.
+    """
+    exercises_collection = db["exercises"]
+    workout_name = workout_plan.workout_name
+    
+    logger.info(f"Processing workout plan: {workout_name} with {len(workout_plan.workout_plan)} days")
+    
+    # Fetch every referenced exercise missing from the search results in one query
+    referenced_exercise_ids = {
+        exercise_ref.exercise_id
+        for day_plan_llm in workout_plan.workout_plan
+        for exercise_ref in day_plan_llm.exercises
+    }
+    missing_exercise_ids = referenced_exercise_ids - exercises_map.keys()
+    if missing_exercise_ids:
+        missing_exercise_docs = await asyncio.to_thread(
+            lambda: list(exercises_collection.find({'_id': {'$in': list(missing_exercise_ids)}}, {'name': 1}))
+        )
+        for exercise_doc in missing_exercise_docs:
+            exercises_map[str(exercise_doc['_id'])] = exercise_doc
+    
+    sets_collection = db["sets"]
+    workouts_collection = db["workouts"]
+    users_collection = db["users"]
+    day_plans = []
+    created_sets = {}
+    created_set_ids = []
+    # Set documents are built in the loop and written with a single insert_many afterwards
+    pending_sets = []
+    
+    for day_plan_llm in workout_plan.workout_plan:
+        day = day_plan_llm.day
+        day_set_ids = []
         
-        for day_plan_raw in day_plans_raw:
-            day = day_plan_raw.get("day")
-            exercises_raw = day_plan_raw.get("exercises", [])
-            
-            if not day or not exercises_raw:
+        for exercise_ref in day_plan_llm.exercises:
+            exercise_id = exercise_ref.exercise_id
+            exercise = exercises_map.get(exercise_id)
+            if not exercise:
+                logger.warning(f"Exercise ID '{exercise_id}' not found in database - skipping")
                 continue
+            exercise_name = exercise.get("name", exercise_id)
             
-            day_set_ids = []
+            reps = exercise_ref.reps
+            weight = exercise_ref.weight
+            duration_sec = exercise_ref.duration_sec
             
-            for exercise_data in exercises_raw:
-                exercise_id = exercise_data.get("exercise_id")
-                if not exercise_id:
-                    logger.warning(f"Skipping exercise with no ID in {day}")
-                    continue
-                
-                exercise = exercises_map.get(str(exercise_id))
-                if exercise:
-                    exercise_name = exercise.get("name", exercise_id)
-                else:
-                    exercise_doc = exercises_collection.find_one({'_id': exercise_id})
-                    if not exercise_doc:
-                        logger.warning(f"Exercise ID '{exercise_id}' not found in database - skipping")
-                        continue
-                    exercise_name = exercise_doc.get("name", exercise_id)
-                
-                reps = exercise_data.get("reps")
-                weight = exercise_data.get("weight")
-                duration_sec = exercise_data.get("duration_sec")
+            if exercise_id in created_sets:
+                set_ids_for_exercise = created_sets[exercise_id]
+                logger.info(f"Reusing existing sets {set_ids_for_exercise} for {exercise_name}")
+                day_set_ids.extend(set_ids_for_exercise)
+            else:
+                # Create 1 to 5 sets (randomly) with unique IDs
+                num_sets = random.randint(1, 5)
+                set_ids_for_exercise = []
                 
-                if exercise_id in created_sets:
-                    set_ids_for_exercise = created_sets[exercise_id]
-                    logger.info(f"Reusing existing sets {set_ids_for_exercise} for {exercise_name}")
-                    day_set_ids.extend(set_ids_for_exercise)
-                else:
-                    # Create 1 to 5 sets (randomly) with unique IDs
-                    num_sets = random.randint(1, 5)
-                    set_ids_for_exercise = []
+                for i in range(num_sets):
+                    set_id = str(ObjectId())
+                    set_name = f"{exercise_name} Set"
                     
-                    for i in range(num_sets):
-                        set_id = str(ObjectId())
-                        set_name = f"{exercise_name} Set"
-                        
-                        set_doc = {
-                            '_id': set_id,
-                            'name': set_name,
-                            'excersise_id': exercise_id,
-                            'exercise_id': exercise_id,
-                        }
-                        
-                        if reps is not None:
-                            set_doc['reps'] = reps
-                        if weight is not None:
-                            set_doc['weight'] = weight
-                        if duration_sec is not None:
-                            set_doc['duration_sec'] = duration_sec
-                        
-                        sets_collection.insert_one(set_doc)
-                        set_ids_for_exercise.append(set_id)
-                        logger.info(f"Created set {set_id} for {exercise_name} ({i+1}/{num_sets})")
+                    set_doc = {
+                        '_id': set_id,
+                        'name': set_name,
+                        'exercise_id': exercise_id,
+                    }
                     
-                    # Store all set_ids for reuse logic
-                    created_sets[exercise_id] = set_ids_for_exercise
-                    # Append all created set IDs to day_set_ids
-                    day_set_ids.extend(set_ids_for_exercise)
-            
-            if day_set_ids:
-                day_plan = {
-                    "day": day,
-                    "exercises_ids": day_set_ids
-                }
-                day_plans.append(day_plan)
-                created_set_ids.extend(day_set_ids)
-                logger.info(f"  {day}: {len(day_set_ids)} set(s)")
-        
-        if not day_plans:
-            logger.error("No valid day plans created from workout plan")
-            raise HTTPException(status_code=500, detail="Failed to create workout: No valid day plans generated")
-        
-        workout_id = str(ObjectId())
-        workout_doc = {
-            '_id': workout_id,
-            'workout_plan': day_plans
-        }
-        
-        workouts_collection.insert_one(workout_doc)
-        logger.info(f"Created workout {workout_id} ({workout_name})")
+                    if reps is not None:
+                        set_doc['reps'] = reps
+                    if weight is not None:
+                        set_doc['weight'] = weight
+                    if duration_sec is not None:
+                        set_doc['duration_sec'] = duration_sec
+                    
+                    pending_sets.append(set_doc)
+                    set_ids_for_exercise.append(set_id)
+                    logger.info(f"Prepared set {set_id} for {exercise_name} ({i+1}/{num_sets})")
+                
+                # Store all set_ids for reuse logic
+                created_sets[exercise_id] = set_ids_for_exercise
+                # Append all created set IDs to day_set_ids
+                day_set_ids.extend(set_ids_for_exercise)
         
-        current_workout_ids = user_doc.get('associated_workout_ids', [])
-        if current_workout_ids is None:
-            current_workout_ids = []
+        if day_set_ids:
+            day_plan = {
+                "day": day,
+                "exercises_ids": day_set_ids
+            }
+            day_plans.append(day_plan)
+            created_set_ids.extend(day_set_ids)
+            logger.info(f"  {day}: {len(day_set_ids)} set(s)")
+    
+    if pending_sets:
+        await asyncio.to_thread(sets_collection.insert_many, pending_sets, ordered=False)
+        logger.info(f"Created {len(pending_sets)} set(s)")
+    
+    if not day_plans:
+        logger.error("No valid day plans created from workout plan")
+        raise HTTPException(status_code=500, detail="Failed to create workout: No valid day plans generated")
+    
+    workout_id = str(ObjectId())
+    workout_doc = {
+        '_id': workout_id,
+        'workout_name': workout_name,
+        'workout_plan': day_plans
+    }
+    if prompt_embedding is not None:
+        workout_doc['prompt_embedding'] = prompt_embedding
+    
+    # The workout insert and the user update are independent, so run both at once
+    await asyncio.gather(
+        asyncio.to_thread(workouts_collection.insert_one, workout_doc),
+        asyncio.to_thread(
+            users_collection.update_one,
+            {'_id': user_id, 'associated_workout_ids': {'$ne': workout_id}},
+            append_workout_id_update(workout_id)
+        )
+    )
+    logger.info(f"Created workout {workout_id} ({workout_name})")
+    logger.info(f"Associated workout {workout_id} with user {user_id}")
+    
+    logger.info(f"Successfully generated workout for user_id: {user_id} - workout_id: {workout_id}")
+    
+    return {
+        "user_id": user_id,
+        "workout_id": workout_id,
+        "workout_name": workout_name,
+        "workout_plan": day_plans,
+        "summary": {
+            "sets_created": len(created_sets),
+            "days": len(day_plans),
+            "total_sets": len(created_set_ids)
+        },
+        "message": f"Successfully generated workout '{workout_name}' and associated it with user"
+    }
+
+
+@router.post("/{user_id}/generate-workout", response_model=Dict[str, Any], tags=["User Workouts"])
+async def generate_workout_for_user(user_id: str, request: GenerateWorkoutRequest, background_tasks: BackgroundTasks, db: Database = Depends(get_database)):
+    """
+    Generate an AI-powered workout plan for an existing user.
+    
+    - **user_id**: ID of the user (must already exist)
+    - **prompt**: Natural language description of the desired workout
+    - **openai_api_key**: (Optional) OpenAI API key
+    
+    Returns the created workout with workout_id and summary.
+    """
+    print(f"[USERS.PY] POST /users/{user_id}/generate-workout endpoint called - Prompt: {request.prompt[:100]}...")
+    logger.info("="*80)
+    logger.info(f"🚀 POST /users/{user_id}/generate-workout endpoint called")
+    logger.info(f"📝 User prompt: {request.prompt}")
+    logger.info("="*80)
+    
+    try:
+        generation = await asyncio.to_thread(prepare_workout_generation, db, user_id, request)
+        if generation.existing_response is not None:
+            return generation.existing_response
+        openai_client = generation.openai_client
+        workout_plan = generation.workout_plan
+        prompt_embedding = generation.prompt_embedding
+        exercises_map = {}
         
-        if workout_id not in current_workout_ids:
-            updated_workout_ids = current_workout_ids + [workout_id]
-            users_collection.update_one(
-                {'_id': user_id},
-                {'$set': {'associated_workout_ids': updated_workout_ids}}
+        if workout_plan is None:
+            exercise_summaries, exercises_map = await collect_candidate_exercises(request.prompt, openai_client, db["exercises"])
+            
+            logger.info("="*60)
+            logger.info("STEP 5: Generating workout plan with LLM (using structured outputs)")
+            logger.info("="*60)
+            logger.info("Calling OpenAI API to generate workout plan with schema enforcement...")
+            try:
+                # Run the blocking call in a worker thread so other requests keep being served
+                response = await asyncio.to_thread(
+                    openai_client.chat.completions.parse,
+                    model="gpt-4o-mini",
+                    messages=build_generation_messages(request.prompt, generation.system_prompt, exercise_summaries),
+                    temperature=0.7,
+                    response_format=WorkoutPlanLLMOutput
+                )
+            except Exception as e:
+                logger.error(f"Error calling OpenAI API: {e}", exc_info=True)
+                raise HTTPException(status_code=500, detail=f"Failed to generate workout plan with OpenAI: {str(e)}")
+            
+            workout_plan = response.choices[0].message.parsed
+            if workout_plan is None:
+                refusal = response.choices[0].message.refusal
+                logger.error(f"OpenAI did not return a workout plan: {refusal}")
+                raise HTTPException(status_code=500, detail=f"Failed to generate workout plan with OpenAI: {refusal}")
+            logger.info("✅ Successfully received structured workout plan from OpenAI")
+            
+            # Caching the plan only helps later requests, so do it after the response is sent
+            background_tasks.add_task(
+                store_cached_workout, db, request.prompt, generation.cache_version, prompt_embedding, workout_plan.model_dump()
             )
-            logger.info(f"Associated workout {workout_id} with user {user_id}")
         
-        logger.info(f"Successfully generated workout for user_id: {user_id} - workout_id: {workout_id}")
-        
-        return {
-            "user_id": user_id,
-            "workout_id": workout_id,
-            "workout_name": workout_name,
-            "workout_plan": day_plans,
-            "summary": {
-                "sets_created": len(created_sets),
-                "days": len(day_plans),
-                "total_sets": len(created_set_ids)
-            },
-            "message": f"Successfully generated workout '{workout_name}' and associated it with user"
-        }
+        return await save_generated_workout(db, user_id, workout_plan, exercises_map, prompt_embedding)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating workout for user_id '{user_id}': {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to generate workout: {str(e)}")
+
+
+def _ndjson_line(event: Dict[str, Any]) -> bytes:
+    """Encode a single NDJSON event line."""
+    return orjson.dumps(event) + b"\n"
+
+
+@router.post("/{user_id}/generate-workout/stream", tags=["User Workouts"])
+async def generate_workout_for_user_stream(user_id: str, request: GenerateWorkoutRequest, background_tasks: BackgroundTasks, db: Database = Depends(get_database)):
+    """
+    Generate an AI-powered workout plan for an existing user, streaming progress as NDJSON.
+    
+    - **user_id**: ID of the user (must already exist)
+    - **prompt**: Natural language description of the desired workout
+    - **openai_api_key**: (Optional) OpenAI API key
     
+    Emits one JSON object per line:
+    - `{"event": "delta", "delta": "..."}` for each chunk of the generated plan
+    - `{"event": "complete", ...}` with the same payload as POST /users/{user_id}/generate-workout
+    - `{"event": "error", "status_code": ..., "detail": "..."}` if generation fails after streaming started
+    """
+    logger.info(f"🚀 POST /users/{user_id}/generate-workout/stream endpoint called")
+    logger.info(f"📝 User prompt: {request.prompt}")
+    
+    # Validation, cache lookup and exercise search happen before streaming so errors keep their status codes
+    try:
+        generation = await asyncio.to_thread(prepare_workout_generation, db, user_id, request)
+        openai_client = generation.openai_client
+        prompt_embedding = generation.prompt_embedding
+        existing_response = generation.existing_response
+        exercises_map = {}
+        messages = None
+        if existing_response is None and generation.workout_plan is None:
+            exercise_summaries, exercises_map = await collect_candidate_exercises(request.prompt, openai_client, db["exercises"])
+            messages = build_generation_messages(request.prompt, generation.system_prompt, exercise_summaries)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error generating workout for user_id '{user_id}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to generate workout: {str(e)}")
+    
+    def event_stream():
+        # Sync generator: StreamingResponse iterates it in a worker thread, so blocking calls are fine here
+        if existing_response is not None:
+            yield _ndjson_line({"event": "complete", **existing_response})
+            return
+        workout_plan = generation.workout_plan
+        try:
+            if workout_plan is None:
+                logger.info("Streaming workout plan from OpenAI...")
+                with openai_client.chat.completions.stream(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.7,
+                    response_format=WorkoutPlanLLMOutput
+                ) as stream:
+                    for event in stream:
+                        if event.type == "content.delta":
+                            yield _ndjson_line({"event": "delta", "delta": event.delta})
+                    message = stream.get_final_completion().choices[0].message
+                
+                workout_plan = message.parsed
+                if workout_plan is None:
+                    raise HTTPException(status_code=500, detail=f"Failed to generate workout plan with OpenAI: {message.refusal}")
+                # Runs once the stream has finished (see background= below), not before the complete event
+                background_tasks.add_task(
+                    store_cached_workout, db, request.prompt, generation.cache_version, prompt_embedding, workout_plan.model_dump()
+                )
+            
+            # This generator runs in Starlette's worker thread; hop back to the event loop for the async save
+            result = anyio.from_thread.run(save_generated_workout, db, user_id, workout_plan, exercises_map, prompt_embedding)
+            yield _ndjson_line({"event": "complete", **result})
+        except HTTPException as e:
+            yield _ndjson_line({"event": "error", "status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error streaming workout for user_id '{user_id}': {e}", exc_info=True)
+            yield _ndjson_line({"event": "error", "status_code": 500, "detail": f"Failed to generate workout: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson", background=background_tasks)
@@ -1,9 +1,12 @@
 """Workout-related API endpoints."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import Dict, Any
+import hashlib
 import logging
+import orjson
 from models import CreateWorkoutRequest
 from database import get_database
+from pymongo.database import Database
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
@@ -12,7 +15,7 @@ router = APIRouter(prefix="/workouts", tags=["Workouts"])
 
 
 @router.post("/", response_model=Dict[str, Any])
-async def create_workout(request: CreateWorkoutRequest):
+async def create_workout(request: CreateWorkoutRequest, db: Database = Depends(get_database)):
     """
     Create a new workout consisting of sets.
     
@@ -24,11 +27,6 @@ async def create_workout(request: CreateWorkoutRequest):
     """
     logger.info(f"POST /workouts/ endpoint called with {len(request.workout_plan)} day plan(s)")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot create workout")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         workouts_collection = db["workouts"]
         
@@ -38,15 +36,17 @@ async def create_workout(request: CreateWorkoutRequest):
         for day_plan in request.workout_plan:
             all_set_ids.update(day_plan.exercises_ids)
         
-        # Check if all set IDs exist
-        for set_id in all_set_ids:
-            set_doc = sets_collection.find_one({'_id': set_id})
-            if not set_doc:
-                logger.warning(f"Set with ID '{set_id}' not found")
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Set with ID '{set_id}' not found. Cannot create workout with non-existent sets."
-                )
+        # Check if all set IDs exist with a single $in query
+        found_set_ids = {
+            doc['_id'] for doc in sets_collection.find({'_id': {'$in': list(all_set_ids)}}, {'_id': 1})
+        }
+        missing_set_ids = all_set_ids - found_set_ids
+        if missing_set_ids:
+            logger.warning(f"Sets with IDs {sorted(missing_set_ids)} not found")
+            raise HTTPException(
+                status_code=404,
+                detail=f"Sets not found: {sorted(missing_set_ids)}. Cannot create workout with non-existent sets."
+            )
         
         # Generate a new ID for the workout
         workout_id = str(ObjectId())
@@ -81,26 +81,22 @@ async def create_workout(request: CreateWorkoutRequest):
 
 
 @router.get("/{workout_id}", response_model=Dict[str, Any])
-async def get_workout(workout_id: str):
+async def get_workout(workout_id: str, request: Request, response: Response, db: Database = Depends(get_database)):
     """
     Get workout information by workout_id.
     
     - **workout_id**: Unique identifier for the workout
     
-    Returns the workout data including workout_id and workout_plan.
+    Returns the workout data including workout_id and workout_plan, with an ETag header.
+    Responds with 304 Not Modified when the If-None-Match header matches the current ETag.
     """
     logger.info(f"GET /workouts/{workout_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot get workout")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         workouts_collection = db["workouts"]
         
         # Find workout by workout_id
-        workout_doc = workouts_collection.find_one({'_id': workout_id})
+        workout_doc = workouts_collection.find_one({'_id': workout_id}, {'workout_plan': 1})
         
         if not workout_doc:
             logger.warning(f"Workout with workout_id '{workout_id}' not found")
@@ -109,6 +105,14 @@ async def get_workout(workout_id: str):
                 detail=f"Workout with workout_id '{workout_id}' not found"
             )
         
+        # Content hash of the plan, so repeat clients can skip the body entirely
+        etag = '"' + hashlib.blake2b(orjson.dumps(workout_doc.get('workout_plan', [])), digest_size=16).hexdigest() + '"'
+        cache_headers = {'ETag': etag, 'Cache-Control': 'private, max-age=60'}
+        if request.headers.get('if-none-match') == etag:
+            logger.info(f"Workout '{workout_id}' not modified")
+            return Response(status_code=304, headers=cache_headers)
+        response.headers.update(cache_headers)
+        
         # Format response
         workout_data = {
             "workout_id": workout_doc.get('_id', workout_id),
@@ -126,7 +130,7 @@ async def get_workout(workout_id: str):
 
 
 @router.delete("/{workout_id}", response_model=Dict[str, Any])
-async def delete_workout(workout_id: str):
+async def delete_workout(workout_id: str, db: Database = Depends(get_database)):
     """
     Delete a workout by workout_id.
     
@@ -136,35 +140,23 @@ async def delete_workout(workout_id: str):
     """
     logger.info(f"DELETE /workouts/{workout_id} endpoint called")
     
-    db = get_database()
-    if db is None:
-        logger.error("Database connection is None - cannot delete workout")
-        raise HTTPException(status_code=500, detail="Database connection not available")
-    
     try:
         workouts_collection = db["workouts"]
         
-        # Check if workout exists
-        workout_doc = workouts_collection.find_one({'_id': workout_id})
-        if not workout_doc:
+        # Delete atomically; None means the workout did not exist
+        workout_doc = workouts_collection.find_one_and_delete({'_id': workout_id}, projection={'_id': 1})
+        if workout_doc is None:
             logger.warning(f"Workout with workout_id '{workout_id}' not found")
             raise HTTPException(
                 status_code=404,
                 detail=f"Workout with workout_id '{workout_id}' not found"
             )
         
-        # Delete workout
-        result = workouts_collection.delete_one({'_id': workout_id})
-        
-        if result.deleted_count == 1:
-            logger.info(f"Successfully deleted workout with workout_id: {workout_id}")
-            return {
-                "message": f"Workout with workout_id '{workout_id}' has been successfully deleted",
-                "workout_id": workout_id
-            }
-        else:
-            logger.error(f"Failed to delete workout '{workout_id}'")
-            raise HTTPException(status_code=500, detail=f"Failed to delete workout with workout_id '{workout_id}'")
+        logger.info(f"Successfully deleted workout with workout_id: {workout_id}")
+        return {
+            "message": f"Workout with workout_id '{workout_id}' has been successfully deleted",
+            "workout_id": workout_id
+        }
     
     except HTTPException:
         raise
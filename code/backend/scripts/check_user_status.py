@@ -5,11 +5,18 @@ Diagnostic script to check user "3" status in the database.
 This helps debug why the history endpoint might be returning 404.
 """
 
-import requests
-import json
+import asyncio
+import httpx
+import orjson
+import os
+import sys
 
-BASE_URL = "http://localhost:8000"
+# Loopback address rather than "localhost", so connecting skips name resolution
+BASE_URL = "http://127.0.0.1:8000"
 USER_ID = "3"
+# Request paths for the test user, built once
+USER_PATH = f"/users/{USER_ID}"
+LATEST_PATH = f"/history/{USER_ID}/latest"
 
 class Colors:
     OKGREEN = '\033[92m'
@@ -19,50 +26,70 @@ class Colors:
     BOLD = '\033[1m'
     OKCYAN = '\033[96m'
 
+if not sys.stdout.isatty() or "NO_COLOR" in os.environ:
+    # Plain output when redirected to a file or a CI log, or when NO_COLOR is set
+    for _name in [name for name in vars(Colors) if name.isupper()]:
+        setattr(Colors, _name, '')
 
-def main():
+
+def _json(response: httpx.Response):
+    """Decode a JSON response body with orjson (faster than response.json())."""
+    return orjson.loads(response.content)
+
+
+async def main_async():
     print(f"\n{Colors.BOLD}{'='*80}{Colors.ENDC}")
     print(f"{Colors.BOLD}Diagnostic Check for User '{USER_ID}'{Colors.ENDC}")
     print(f"{Colors.BOLD}{'='*80}{Colors.ENDC}\n")
     
     try:
-        # Check if user exists
-        print(f"{Colors.OKCYAN}1. Checking if user exists...{Colors.ENDC}")
-        response = requests.get(f"{BASE_URL}/users/{USER_ID}")
-        
-        if response.status_code == 404:
-            print(f"{Colors.FAIL}✗ User '{USER_ID}' does NOT exist{Colors.ENDC}")
-            print(f"\n{Colors.WARNING}Action needed:{Colors.ENDC}")
-            print(f"  Run: python scripts/setup_test_user.py")
-            return
-        
-        response.raise_for_status()
-        user_data = response.json()
-        print(f"{Colors.OKGREEN}✓ User '{USER_ID}' exists{Colors.ENDC}")
-        
-        # Check associated workouts
-        print(f"\n{Colors.OKCYAN}2. Checking associated workouts...{Colors.ENDC}")
-        workout_ids = user_data.get('associated_workout_ids', [])
-        
-        print(f"   User data: {json.dumps(user_data, indent=2)}")
-        
-        if not workout_ids or workout_ids == []:
-            print(f"\n{Colors.FAIL}✗ User has NO associated workouts{Colors.ENDC}")
-            print(f"\n{Colors.WARNING}This is why you're getting a 404!{Colors.ENDC}")
-            print(f"\n{Colors.WARNING}Action needed:{Colors.ENDC}")
-            print(f"  Run: python scripts/setup_test_user.py")
-            print(f"  This will generate a workout and associate it with user '{USER_ID}'")
-            return
-        
-        print(f"{Colors.OKGREEN}✓ User has {len(workout_ids)} associated workout(s){Colors.ENDC}")
-        print(f"   Workout IDs: {workout_ids}")
+        async with httpx.AsyncClient(base_url=BASE_URL, timeout=10) as client:
+            # Check if user exists
+            print(f"{Colors.OKCYAN}1. Checking if user exists...{Colors.ENDC}")
+            response = await client.get(USER_PATH)
+            
+            if response.status_code == 404:
+                print(f"{Colors.FAIL}✗ User '{USER_ID}' does NOT exist{Colors.ENDC}")
+                print(f"\n{Colors.WARNING}Action needed:{Colors.ENDC}")
+                print(f"  Run: python scripts/setup_test_user.py")
+                return
+            
+            response.raise_for_status()
+            user_data = _json(response)
+            print(f"{Colors.OKGREEN}✓ User '{USER_ID}' exists{Colors.ENDC}")
+            
+            # Check associated workouts
+            print(f"\n{Colors.OKCYAN}2. Checking associated workouts...{Colors.ENDC}")
+            workout_ids = user_data.get('associated_workout_ids', [])
+            
+            print(f"   User data: {orjson.dumps(user_data, option=orjson.OPT_INDENT_2).decode()}")
+            
+            if not workout_ids or workout_ids == []:
+                print(f"\n{Colors.FAIL}✗ User has NO associated workouts{Colors.ENDC}")
+                print(f"\n{Colors.WARNING}This is why you're getting a 404!{Colors.ENDC}")
+                print(f"\n{Colors.WARNING}Action needed:{Colors.ENDC}")
+                print(f"  Run: python scripts/setup_test_user.py")
+                print(f"  This will generate a workout and associate it with user '{USER_ID}'")
+                return
+            
+            print(f"{Colors.OKGREEN}✓ User has {len(workout_ids)} associated workout(s){Colors.ENDC}")
+            print(f"   Workout IDs: {workout_ids}")
+            
+            # The remaining checks are independent, so issue them all at once
+            workout_responses, health_response, history_response = await asyncio.gather(
+                asyncio.gather(*(client.get(f"/workouts/{workout_id}") for workout_id in workout_ids)),
+                client.get("/history/health"),
+                client.get(LATEST_PATH, params={"include_sets": "false"}),
+                return_exceptions=True
+            )
         
         # Check if workouts actually exist
         print(f"\n{Colors.OKCYAN}3. Verifying workouts exist...{Colors.ENDC}")
-        for workout_id in workout_ids:
-            workout_response = requests.get(f"{BASE_URL}/workouts/{workout_id}")
+        if isinstance(workout_responses, Exception):
+            raise workout_responses
+        for workout_id, workout_response in zip(workout_ids, workout_responses):
             if workout_response.status_code == 200:
-                workout_data = workout_response.json()
+                workout_data = _json(workout_response)
                 workout_plan = workout_data.get('workout_plan', [])
                 print(f"{Colors.OKGREEN}✓ Workout '{workout_id}' exists with {len(workout_plan)} day(s){Colors.ENDC}")
             else:
@@ -70,33 +97,32 @@ def main():
         
         # Test if history router is loaded
         print(f"\n{Colors.OKCYAN}4. Checking if history router is loaded...{Colors.ENDC}")
-        try:
-            health_response = requests.get(f"{BASE_URL}/history/health")
-            if health_response.status_code == 200:
-                print(f"{Colors.OKGREEN}✓ History router is loaded{Colors.ENDC}")
-            else:
-                print(f"{Colors.FAIL}✗ History router health check failed: {health_response.status_code}{Colors.ENDC}")
-        except Exception as e:
-            print(f"{Colors.FAIL}✗ History router not accessible: {str(e)}{Colors.ENDC}")
+        if isinstance(health_response, Exception):
+            print(f"{Colors.FAIL}✗ History router not accessible: {str(health_response)}{Colors.ENDC}")
             print(f"\n{Colors.WARNING}The history router may not be registered in main.py{Colors.ENDC}")
             print(f"{Colors.WARNING}Please restart the server if you just added the router{Colors.ENDC}")
+        elif health_response.status_code == 200:
+            print(f"{Colors.OKGREEN}✓ History router is loaded{Colors.ENDC}")
+        else:
+            print(f"{Colors.FAIL}✗ History router health check failed: {health_response.status_code}{Colors.ENDC}")
         
         # Try to get history
         print(f"\n{Colors.OKCYAN}5. Testing history endpoint...{Colors.ENDC}")
-        history_response = requests.get(f"{BASE_URL}/history/{USER_ID}/latest")
+        if isinstance(history_response, Exception):
+            raise history_response
         
         if history_response.status_code == 200:
             print(f"{Colors.OKGREEN}✓ History endpoint works!{Colors.ENDC}")
-            history_data = history_response.json()
+            history_data = _json(history_response)
             print(f"   Current day: {history_data.get('day_name')}")
-            print(f"   Sets: {len(history_data.get('sets', []))}")
+            print(f"   Sets: {history_data.get('progress', {}).get('total_sets', 0)}")
             print(f"\n{Colors.OKGREEN}{Colors.BOLD}Everything looks good! You can run the test:{Colors.ENDC}")
             print(f"  python scripts/test_history_workflow.py")
         else:
             print(f"{Colors.FAIL}✗ History endpoint returned {history_response.status_code}{Colors.ENDC}")
             print(f"   Error: {history_response.text}")
             
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print(f"{Colors.FAIL}✗ Could not connect to API{Colors.ENDC}")
         print(f"\n{Colors.WARNING}Action needed:{Colors.ENDC}")
         print(f"  Start the server: python main.py")
@@ -107,4 +133,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main_async())
@@ -9,14 +9,28 @@ Usage:
     python scripts/setup_test_user.py
 """
 
-import requests
-import json
-from typing import Dict, Any
+import atexit
+import httpx
+import orjson
+import os
+import sys
+from typing import Any, Optional
 
 # Configuration
-BASE_URL = "http://localhost:8000"
+# Loopback address rather than "localhost", so connecting skips name resolution
+BASE_URL = "http://127.0.0.1:8000"
 USER_ID = "3"
 
+# Shared client so all calls reuse one keep-alive connection to the API
+# Failed connection attempts are retried by the transport (with exponential backoff)
+CLIENT = httpx.Client(
+    base_url=BASE_URL,
+    timeout=10.0,
+    headers={"Accept": "application/json"},
+    transport=httpx.HTTPTransport(retries=3)
+)
+atexit.register(CLIENT.close)
+
 # Color codes for terminal output
 class Colors:
     OKGREEN = '\033[92m'
@@ -26,71 +40,85 @@ class Colors:
     BOLD = '\033[1m'
     OKCYAN = '\033[96m'
 
+if not sys.stdout.isatty() or "NO_COLOR" in os.environ:
+    # Plain output when redirected to a file or a CI log, or when NO_COLOR is set
+    for _name in [name for name in vars(Colors) if name.isupper()]:
+        setattr(Colors, _name, '')
+
+# Message templates, built once instead of on every message
+_OK = f"{Colors.OKGREEN}✓ %s{Colors.ENDC}"
+_INFO = f"{Colors.OKCYAN}ℹ %s{Colors.ENDC}"
+_WARN = f"{Colors.WARNING}⚠ %s{Colors.ENDC}"
+_ERR = f"{Colors.FAIL}✗ %s{Colors.ENDC}"
+
 
 def print_success(text: str):
     """Print success message."""
-    print(f"{Colors.OKGREEN}✓ {text}{Colors.ENDC}")
+    print(_OK % text)
 
 
 def print_info(text: str):
     """Print info message."""
-    print(f"{Colors.OKCYAN}ℹ {text}{Colors.ENDC}")
+    print(_INFO % text)
 
 
 def print_error(text: str):
     """Print error message."""
-    print(f"{Colors.FAIL}✗ {text}{Colors.ENDC}")
+    print(_ERR % text)
 
 
 def print_warning(text: str):
     """Print warning message."""
-    print(f"{Colors.WARNING}⚠ {text}{Colors.ENDC}")
+    print(_WARN % text)
+
 
+def _json(response: httpx.Response) -> Any:
+    """Decode a JSON response body with orjson (faster than response.json())."""
+    return orjson.loads(response.content)
 
-def create_or_verify_user(user_id: str) -> bool:
-    """Create user if doesn't exist, or verify if exists."""
-    print_info(f"Checking if user '{user_id}' exists...")
+
+def create_or_verify_user(user_id: str) -> Optional[bool]:
+    """
+    Create user if doesn't exist, or verify if exists.
     
-    # Try to get user
-    try:
-        response = requests.get(f"{BASE_URL}/users/{user_id}")
-        if response.status_code == 200:
-            print_success(f"User '{user_id}' already exists")
-            return True
-    except Exception:
-        pass
+    Returns True if the user was created, False if it already existed, None on failure.
+    """
+    print_info(f"Creating user '{user_id}' if it doesn't exist...")
     
-    # User doesn't exist, create it
-    print_info(f"Creating user '{user_id}'...")
+    # Create optimistically: the API answers 409 if the user already exists
     try:
-        response = requests.post(f"{BASE_URL}/users/{user_id}")
+        response = CLIENT.post(f"/users/{user_id}")
+        if response.status_code == 409:
+            print_success(f"User '{user_id}' already exists")
+            return False
         response.raise_for_status()
         print_success(f"Created user '{user_id}'")
         return True
-    except Exception as e:
-        print_error(f"Failed to create user: {str(e)}")
-        return False
+    except httpx.HTTPStatusError as e:
+        print_error(f"Failed to create user: {e.response.status_code} - {e.response.text}")
+        return None
 
 
-def get_sample_exercises() -> list:
-    """Get some sample exercises from the database."""
-    print_info("Fetching available exercises...")
+def check_exercises_available() -> bool:
+    """Check that the database has exercises for the AI workout generator to use."""
+    print_info("Checking for available exercises...")
     
     try:
-        response = requests.get(f"{BASE_URL}/exercises?limit=20")
+        # A single exercise is enough to tell whether the collection is populated
+        response = CLIENT.get("/exercises/", params={"limit": 1})  # Trailing slash: the route is "/exercises/" and httpx does not follow the 307
         response.raise_for_status()
-        exercises = response.json()
+        exercises = _json(response)
         
         if not exercises:
             print_warning("No exercises found in database")
             print_info("Please run exercise import first, or the workout generation may fail")
-            return []
+            return False
         
-        print_success(f"Found {len(exercises)} exercises")
-        return exercises
+        print_success("Exercises are available")
+        return True
     except Exception as e:
-        print_error(f"Failed to get exercises: {str(e)}")
-        return []
+        print_error(f"Failed to check exercises: {str(e)}")
+        return False
 
 
 def create_workout_with_ai(user_id: str) -> bool:
@@ -101,12 +129,14 @@ def create_workout_with_ai(user_id: str) -> bool:
     prompt = "I want a 3-day beginner workout plan focusing on bodyweight exercises for full body strength"
     
     try:
-        response = requests.post(
-            f"{BASE_URL}/users/{user_id}/generate-workout",
-            json={"prompt": prompt}
+        response = CLIENT.post(
+            f"/users/{user_id}/generate-workout",
+            content=orjson.dumps({"prompt": prompt}),
+            headers={"Content-Type": "application/json"},
+            timeout=120.0  # Search plus LLM generation takes far longer than the default timeout
         )
         response.raise_for_status()
-        result = response.json()
+        result = _json(response)
         
         workout_id = result.get('workout_id')
         workout_name = result.get('workout_name', 'Generated Workout')
@@ -117,7 +147,7 @@ def create_workout_with_ai(user_id: str) -> bool:
         print_success(f"Days in plan: {days}")
         return True
         
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         print_error(f"Failed to generate workout: {e.response.status_code}")
         if e.response.status_code == 400:
             print_warning("This might be due to missing OpenAI API key")
@@ -133,9 +163,9 @@ def verify_user_has_workout(user_id: str) -> bool:
     print_info(f"Verifying user '{user_id}' has workouts...")
     
     try:
-        response = requests.get(f"{BASE_URL}/users/{user_id}")
+        response = CLIENT.get(f"/users/{user_id}")
         response.raise_for_status()
-        user_data = response.json()
+        user_data = _json(response)
         
         workout_ids = user_data.get('associated_workout_ids', [])
         if workout_ids:
@@ -161,20 +191,21 @@ def main():
     
     try:
         # Step 1: Create or verify user exists
-        if not create_or_verify_user(USER_ID):
+        created = create_or_verify_user(USER_ID)
+        if created is None:
             print_error("Failed to create/verify user - aborting")
             return False
         
-        # Step 2: Check if user already has workouts
-        has_workout = verify_user_has_workout(USER_ID)
+        # Step 2: Check if user already has workouts (a user created just now has none)
+        has_workout = not created and verify_user_has_workout(USER_ID)
         
         if has_workout:
             print_success("\nUser is already set up and ready for testing!")
             print_info("You can now run: python scripts/test_history_workflow.py")
             return True
         
-        # Step 3: Get available exercises
-        exercises = get_sample_exercises()
+        # Step 3: Warn early if there are no exercises to build a workout from
+        check_exercises_available()
         
         # Step 4: Generate a workout plan
         print(f"\n{Colors.BOLD}Generating workout plan...{Colors.ENDC}\n")
@@ -191,7 +222,7 @@ def main():
             print_warning("3. Or manually create a workout for user '3'")
             return False
         
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print_error("\nCould not connect to API")
         print_info("Make sure the server is running: python main.py")
         return False
@@ -7,16 +7,44 @@ demonstrating the automatic day progression feature.
 
 Usage:
     python scripts/test_history_workflow.py
+    python scripts/test_history_workflow.py --animate  # Pause between days so the output can be followed
+    python scripts/test_history_workflow.py --json     # One JSON object per line, for CI logs
+    python scripts/test_history_workflow.py --per-set  # Drive /update and /complete for every set
+
+The default mode calls POST /testing/{user_id}/simulate, which the server only exposes when
+it is started with ENABLE_TESTING_ENDPOINTS set. --per-set works against any server.
 """
 
-import requests
-import json
+import argparse
+import asyncio
+import httpx
+import orjson
+import os
+import sys
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 # Configuration
-BASE_URL = "http://localhost:8000"
+# Loopback address rather than "localhost", so connecting skips name resolution
+BASE_URL = "http://127.0.0.1:8000"
 USER_ID = "3"
+# Request paths for the test user, built once
+LATEST_PATH = f"/history/{USER_ID}/latest"
+UPDATE_PATH = f"/history/{USER_ID}/update"
+COMPLETE_PATH = f"/history/{USER_ID}/complete"
+SIMULATE_PATH = f"/testing/{USER_ID}/simulate"
+# Most days the /testing simulate endpoint accepts per request (SimulateDaysRequest.days)
+MAX_SIMULATE_DAYS = 100
+# Share of each set's target reps the simulated user completes
+REP_RATIO = 0.7
+# Seconds to pause between simulated days; 0 runs at full speed (set with WORKOUT_DELAY or --animate)
+DELAY = float(os.environ.get("WORKOUT_DELAY", "0"))
+# Full passes through the workout plan to simulate (set from --weeks)
+WEEKS = 1
+# Emit one JSON object per line instead of colored text (set from --json)
+JSON_OUTPUT = False
+# Complete every set through /update and /complete instead of one /testing simulate call (set from --per-set)
+PER_SET = False
 
 # Color codes for terminal output
 class Colors:
@@ -30,62 +58,181 @@ class Colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
+if not sys.stdout.isatty() or "NO_COLOR" in os.environ:
+    # Plain output when redirected to a file or a CI log, or when NO_COLOR is set
+    for _name in [name for name in vars(Colors) if name.isupper()]:
+        setattr(Colors, _name, '')
+
+# Message templates, built once instead of on every message
+_OK = f"{Colors.OKGREEN}✓ %s{Colors.ENDC}"
+_INFO = f"{Colors.OKCYAN}ℹ %s{Colors.ENDC}"
+_WARN = f"{Colors.WARNING}⚠ %s{Colors.ENDC}"
+_ERR = f"{Colors.FAIL}✗ %s{Colors.ENDC}"
+_HEADER_BAR = f"{Colors.HEADER}{Colors.BOLD}{'='*80}{Colors.ENDC}"
+
+# Two-line entry for one set in display_history
+_ROW_FMT = "   {color}{status} Set {idx}: {exercise_name}{end}\n      Target: {target} reps | Completed: {completed} reps"
+
+
+def pause():
+    """Pause so the demo output can be followed, if a delay is configured."""
+    if DELAY:
+        time.sleep(DELAY)
+
+
+def emit(event: Dict[str, Any]):
+    """Write one JSON line for --json output."""
+    sys.stdout.write(orjson.dumps(event).decode() + "\n")
+
+
+def format_header(text: str) -> str:
+    """Format a header block (without the trailing newline)."""
+    return f"\n{_HEADER_BAR}\n{Colors.HEADER}{Colors.BOLD}{text.center(80)}{Colors.ENDC}\n{_HEADER_BAR}\n"
+
 
 def print_header(text: str):
     """Print a formatted header."""
-    print(f"\n{Colors.HEADER}{Colors.BOLD}{'='*80}{Colors.ENDC}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{text.center(80)}{Colors.ENDC}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{'='*80}{Colors.ENDC}\n")
+    if JSON_OUTPUT:
+        emit({"event": "header", "text": text})
+        return
+    sys.stdout.write(format_header(text) + "\n")
 
 
 def print_success(text: str):
     """Print success message."""
-    print(f"{Colors.OKGREEN}✓ {text}{Colors.ENDC}")
+    if JSON_OUTPUT:
+        emit({"level": "success", "msg": text.strip()})
+        return
+    print(_OK % text)
 
 
 def print_info(text: str):
     """Print info message."""
-    print(f"{Colors.OKCYAN}ℹ {text}{Colors.ENDC}")
+    if JSON_OUTPUT:
+        emit({"level": "info", "msg": text.strip()})
+        return
+    print(_INFO % text)
 
 
 def print_warning(text: str):
     """Print warning message."""
-    print(f"{Colors.WARNING}⚠ {text}{Colors.ENDC}")
+    if JSON_OUTPUT:
+        emit({"level": "warning", "msg": text.strip()})
+        return
+    print(_WARN % text)
 
 
 def print_error(text: str):
     """Print error message."""
-    print(f"{Colors.FAIL}✗ {text}{Colors.ENDC}")
+    if JSON_OUTPUT:
+        emit({"level": "error", "msg": text.strip()})
+        return
+    print(_ERR % text)
+
+
+class TestingEndpointsDisabled(Exception):
+    """The server was started without ENABLE_TESTING_ENDPOINTS, so /testing is not available."""
+
+
+def _json(response: httpx.Response) -> Any:
+    """Decode a JSON response body with orjson (faster than response.json())."""
+    return orjson.loads(response.content)
 
 
-def get_latest_history() -> Dict[str, Any]:
+async def get_latest_history(client: httpx.AsyncClient, include_sets: bool = True) -> Dict[str, Any]:
     """Get the latest history for the user."""
-    response = requests.get(f"{BASE_URL}/history/{USER_ID}/latest")
+    response = await client.get(LATEST_PATH, params=None if include_sets else {"include_sets": "false"})
     response.raise_for_status()
-    return response.json()
+    return _json(response)
 
 
-def update_set_progress(set_id: str, completed_reps: int):
-    """Update progress on a set."""
-    response = requests.post(
-        f"{BASE_URL}/history/{USER_ID}/update",
-        json={
-            "set_id": set_id,
-            "completed_reps": completed_reps
-        }
+async def post_json(client: httpx.AsyncClient, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST a JSON body encoded with orjson and decode the JSON response."""
+    response = await client.post(
+        path,
+        content=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"}
     )
     response.raise_for_status()
-    return response.json()
+    return _json(response)
+
+
+async def complete_set(client: httpx.AsyncClient, set_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Record partial progress on a set, then mark it complete."""
+    target_reps = set_data.get('target_reps')
+    if target_reps:
+        await post_json(client, UPDATE_PATH, {"set_id": set_data['set_id'], "completed_reps": int(target_reps * REP_RATIO)})
+    return await post_json(client, COMPLETE_PATH, {"set_id": set_data['set_id']})
+
+
+async def complete_day_per_set(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """
+    Complete the current day through the regular history endpoints, one set at a time.
+
+    Returns a summary of the day in the same shape as the entries of the simulate response.
+    """
+    history = await get_latest_history(client)
+    pending = [s for s in history.get('sets') or [] if not s.get('is_complete')]
+    
+    # The sets are independent; the server makes sure only one completion starts the next day
+    results = await asyncio.gather(*(complete_set(client, set_data) for set_data in pending))
+    new_day_name = next((r['new_day_name'] for r in results if r.get('new_day_started')), None)
+    
+    return {
+        "history_id": history.get('history_id'),
+        "day_index": history.get('current_day_index'),
+        "day_name": history.get('day_name'),
+        "total_sets": history.get('progress', {}).get('total_sets', 0),
+        "sets_completed": len(pending),
+        "new_day_name": new_day_name
+    }
+
 
+async def complete_days_per_set(client: httpx.AsyncClient, days: int) -> List[Dict[str, Any]]:
+    """Complete the next days set by set, and report them like the simulate endpoint does."""
+    simulated_days = []
+    for _ in range(days):
+        day = await complete_day_per_set(client)
+        simulated_days.append(day)
+        if not day.get('new_day_name'):
+            break
+    return simulated_days
 
-def complete_set(set_id: str) -> Dict[str, Any]:
-    """Mark a set as complete."""
-    response = requests.post(
-        f"{BASE_URL}/history/{USER_ID}/complete",
-        json={"set_id": set_id}
+
+async def simulate_days(client: httpx.AsyncClient, days: int) -> Dict[str, Any]:
+    """Have the server complete the next days of the workout plan in one request."""
+    response = await client.post(
+        SIMULATE_PATH,
+        content=orjson.dumps({"days": days, "rep_ratio": REP_RATIO}),
+        headers={"Content-Type": "application/json"},
+        timeout=60.0  # Each simulated day takes several database round trips on the server
     )
+    if response.status_code == 404 and _json(response).get('detail') == "Not Found":
+        # The route itself is missing, not the user's history
+        raise TestingEndpointsDisabled()
     response.raise_for_status()
-    return response.json()
+    return _json(response)
+
+
+async def simulate_all_days(client: httpx.AsyncClient, days: int) -> List[Dict[str, Any]]:
+    """Simulate any number of days, in requests of at most MAX_SIMULATE_DAYS days each."""
+    simulated_days = []
+    remaining = days
+    while remaining > 0:
+        chunk = (await simulate_days(client, min(remaining, MAX_SIMULATE_DAYS))).get('days', [])
+        simulated_days.extend(chunk)
+        if len(chunk) < min(remaining, MAX_SIMULATE_DAYS):
+            # The server stopped early (no next day), so there is nothing left to simulate
+            break
+        remaining -= len(chunk)
+    return simulated_days
+
+
+async def get_plan_day_count(client: httpx.AsyncClient, workout_id: str) -> int:
+    """Get the number of days in the workout plan."""
+    response = await client.get(f"/workouts/{workout_id}")
+    response.raise_for_status()
+    return len(_json(response).get('workout_plan', []))
 
 
 def display_history(history: Dict[str, Any]):
@@ -94,12 +241,24 @@ def display_history(history: Dict[str, Any]):
     progress = history.get('progress', {})
     sets = history.get('sets', [])
     
-    print(f"\n{Colors.BOLD}📅 Current Day: {day_name}{Colors.ENDC}")
-    print(f"   Day Index: {history.get('current_day_index', 0)}")
-    print(f"   Progress: {progress.get('completed_sets', 0)}/{progress.get('total_sets', 0)} sets "
-          f"({progress.get('completion_percentage', 0)}%)")
+    if JSON_OUTPUT:
+        emit({
+            "event": "history",
+            "day": day_name,
+            "day_index": history.get('current_day_index', 0),
+            "progress": progress,
+            "sets": [{"id": s.get('set_id'), "done": bool(s.get('is_complete'))} for s in sets]
+        })
+        return
     
-    print(f"\n{Colors.BOLD}Sets:{Colors.ENDC}")
+    # Build the whole block first and write it in one call instead of printing line by line
+    lines = [
+        f"\n{Colors.BOLD}📅 Current Day: {day_name}{Colors.ENDC}",
+        f"   Day Index: {history.get('current_day_index', 0)}",
+        f"   Progress: {progress.get('completed_sets', 0)}/{progress.get('total_sets', 0)} sets "
+        f"({progress.get('completion_percentage', 0)}%)",
+        f"\n{Colors.BOLD}Sets:{Colors.ENDC}",
+    ]
     for idx, set_data in enumerate(sets, 1):
         status = "✓" if set_data.get('is_complete') else "○"
         exercise_name = set_data.get('exercise_name', 'Unknown Exercise')
@@ -111,147 +270,131 @@ def display_history(history: Dict[str, Any]):
         else:
             color = Colors.WARNING
         
-        print(f"   {color}{status} Set {idx}: {exercise_name}{Colors.ENDC}")
-        print(f"      Target: {target_reps} reps | Completed: {completed_reps} reps")
+        lines.append(_ROW_FMT.format_map({
+            'color': color,
+            'status': status,
+            'idx': idx,
+            'exercise_name': exercise_name,
+            'end': Colors.ENDC,
+            'target': target_reps,
+            'completed': completed_reps
+        }))
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def complete_day(week_num: int = 1):
-    """Complete all sets for the current day."""
-    history = get_latest_history()
-    day_name = history.get('day_name', 'Unknown')
-    day_index = history.get('current_day_index', 0)
+def display_simulated_day(day: Dict[str, Any], week_num: int):
+    """Display the result of one simulated day."""
+    day_name = day.get('day_name', 'Unknown')
+    day_index = day.get('day_index', 0)
     
-    print_header(f"Week {week_num} - Day {day_index + 1}: {day_name}")
-    display_history(history)
-    
-    sets = history.get('sets', [])
-    
-    if not sets:
-        print_warning(f"No sets found for {day_name}")
+    if JSON_OUTPUT:
+        emit({"event": "day", "week": week_num, **day})
         return
     
-    print(f"\n{Colors.BOLD}Starting workout...{Colors.ENDC}\n")
+    # Build the whole block first and write it in one call
+    lines = [
+        format_header(f"Week {week_num} - Day {day_index + 1}: {day_name}"),
+        _OK % f"Completed {day.get('sets_completed', 0)}/{day.get('total_sets', 0)} set(s) at {REP_RATIO:.0%} of the target reps",
+    ]
+    if day.get('new_day_name'):
+        lines.append(f"\n{Colors.OKGREEN}{Colors.BOLD}🎉 Day complete! Started new day: {day['new_day_name']}{Colors.ENDC}")
     
-    for idx, set_data in enumerate(sets, 1):
-        set_id = set_data.get('set_id')
-        set_name = set_data.get('set_name', 'Unknown Set')
-        exercise_name = set_data.get('exercise_name', 'Unknown Exercise')
-        target_reps = set_data.get('target_reps', 0)
-        
-        if set_data.get('is_complete'):
-            print_info(f"Set {idx} ({exercise_name}) already complete - skipping")
-            continue
-        
-        print(f"\n{Colors.BOLD}Set {idx}/{len(sets)}: {exercise_name}{Colors.ENDC}")
-        print(f"   Target: {target_reps} reps")
-        
-        # Simulate doing the exercise with partial progress
-        if target_reps:
-            partial_reps = int(target_reps * 0.7)  # Complete 70% first
-            print(f"   Doing reps... ", end='', flush=True)
-            time.sleep(0.5)
-            print(f"{partial_reps} reps done")
-            
-            # Update progress
-            result = update_set_progress(set_id, partial_reps)
-            print_success(f"Updated progress: {partial_reps}/{target_reps} reps")
-            
-            # Complete the remaining reps
-            print(f"   Finishing set... ", end='', flush=True)
-            time.sleep(0.5)
-            print(f"{target_reps} reps total!")
-        else:
-            print(f"   Completing... ", end='', flush=True)
-            time.sleep(0.5)
-            print("Done!")
-        
-        # Mark set as complete
-        result = complete_set(set_id)
-        print_success(f"Set complete!")
-        
-        # Check if day/week completed
-        if result.get('new_day_started'):
-            print(f"\n{Colors.OKGREEN}{Colors.BOLD}🎉 {result.get('message')}{Colors.ENDC}")
-            time.sleep(1)
-            return True
-        elif result.get('day_complete'):
-            print(f"\n{Colors.OKGREEN}{Colors.BOLD}🎉 {result.get('message')}{Colors.ENDC}")
-            time.sleep(1)
-            return False
-    
-    return False
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def main():
+async def main():
     """Main test workflow."""
     print_header("History Tracking Test - Full Week Simulation")
     print_info(f"Testing with User ID: {USER_ID}")
     print_info(f"API Base URL: {BASE_URL}\n")
     
     try:
-        # Check initial state
-        print_header("Initial State")
-        try:
-            initial_history = get_latest_history()
-            display_history(initial_history)
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                print_error("User not found or user has no workouts!")
-                print_warning("\nPlease run the setup script first:")
-                print_info("  python scripts/setup_test_user.py")
-                print_info("\nThis will create user '3' and generate a workout plan.")
-                return
-            raise
-        
-        input(f"\n{Colors.BOLD}Press Enter to start the workout week...{Colors.ENDC}")
-        
-        # Simulate a full week (7 days)
-        week_num = 1
-        day_count = 0
-        max_days = 20  # Safety limit to prevent infinite loops
-        
-        while day_count < max_days:
-            has_next_day = complete_day(week_num)
-            day_count += 1
+        # Failed connection attempts are retried by the transport (with exponential backoff)
+        async with httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=10.0,
+            headers={"Accept": "application/json"},
+            transport=httpx.AsyncHTTPTransport(retries=3)
+        ) as client:
+            # Check initial state
+            print_header("Initial State")
+            try:
+                initial_history = await get_latest_history(client)
+                display_history(initial_history)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    print_error("User not found or user has no workouts!")
+                    print_warning("\nPlease run the setup script first:")
+                    print_info("  python scripts/setup_test_user.py")
+                    print_info("\nThis will create user '3' and generate a workout plan.")
+                    return
+                raise
+            
+            if not JSON_OUTPUT:
+                input(f"\n{Colors.BOLD}Press Enter to start the workout week...{Colors.ENDC}")
             
-            if not has_next_day:
-                # Check if there's another day in the plan
+            # Work through every day of the plan WEEKS times, plus one more day to cover the
+            # rollover from the last day back to the first
+            total_days = await get_plan_day_count(client, initial_history.get('workout_id'))
+            days_to_simulate = WEEKS * total_days + 1
+            print_info(f"Workout plan has {total_days} day(s) - simulating {days_to_simulate}")
+            
+            if PER_SET:
+                # Exercise the regular /update and /complete endpoints end to end
+                simulated_days = await complete_days_per_set(client, days_to_simulate)
+            else:
+                # The server replays the simulation, so this is a single request for up to
+                # MAX_SIMULATE_DAYS days
                 try:
-                    history = get_latest_history()
-                    if day_count > 0 and history.get('current_day_index') == 0:
-                        # We've wrapped around to a new week
-                        week_num += 1
-                        print_header(f"Starting Week {week_num}!")
-                        
-                        if week_num > 2:
-                            print_success("Successfully completed 2 full weeks!")
-                            print_info("Test cycle complete - stopping here.")
-                            break
-                    
-                    # Small delay before next day
-                    time.sleep(1)
-                except Exception as e:
-                    print_warning(f"Reached end of workout plan: {str(e)}")
+                    simulated_days = await simulate_all_days(client, days_to_simulate)
+                except TestingEndpointsDisabled:
+                    print_error("The server does not expose the /testing endpoints")
+                    print_info("  Start it with ENABLE_TESTING_ENDPOINTS=1, or run this script with --per-set")
+                    return
+            
+            week_num = 1
+            day_count = len(simulated_days)
+            
+            for day in simulated_days:
+                display_simulated_day(day, week_num)
+                
+                if not day.get('new_day_name'):
+                    # The server stops when a day does not lead to a new one
+                    print_warning(f"No new day was started after {day.get('day_name', 'Unknown')} - stopping here")
                     break
-            else:
-                # Automatically moved to next day
-                time.sleep(1)
-        
-        # Final summary
-        print_header("Test Complete - Final Summary")
-        final_history = get_latest_history()
-        display_history(final_history)
-        
-        print(f"\n{Colors.OKGREEN}{Colors.BOLD}✓ Test completed successfully!{Colors.ENDC}")
-        print(f"\n{Colors.BOLD}Summary:{Colors.ENDC}")
-        print(f"   Total days completed: {day_count}")
-        print(f"   Weeks completed: {week_num}")
-        print(f"   Current day: {final_history.get('day_name', 'Unknown')}")
-        print(f"   Current day index: {final_history.get('current_day_index', 0)}")
+                
+                if day.get('day_index') == total_days - 1:
+                    # Finishing the last day loops back to the first one
+                    week_num += 1
+                    print_header(f"Starting Week {week_num}!")
+                
+                pause()
+            
+            # Final summary
+            print_header("Test Complete - Final Summary")
+            final_history = await get_latest_history(client)
+            display_history(final_history)
+            
+        summary = {
+            "days_completed": day_count,
+            "weeks": week_num,
+            "current_day": final_history.get('day_name', 'Unknown'),
+            "current_day_index": final_history.get('current_day_index', 0)
+        }
+        if JSON_OUTPUT:
+            emit({"event": "summary", **summary})
+        else:
+            print(f"\n{Colors.OKGREEN}{Colors.BOLD}✓ Test completed successfully!{Colors.ENDC}")
+            print(f"\n{Colors.BOLD}Summary:{Colors.ENDC}")
+            print(f"   Total days completed: {summary['days_completed']}")
+            print(f"   Weeks completed: {summary['weeks']}")
+            print(f"   Current day: {summary['current_day']}")
+            print(f"   Current day index: {summary['current_day_index']}")
         
-    except requests.exceptions.ConnectionError:
-        print_error("Could not connect to API. Make sure the server is running at http://localhost:8000")
-    except requests.exceptions.HTTPError as e:
+    except httpx.ConnectError:
+        print_error(f"Could not connect to API. Make sure the server is running at {BASE_URL}")
+    except httpx.HTTPStatusError as e:
         print_error(f"HTTP Error: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         print_error(f"Error: {str(e)}")
@@ -260,4 +403,41 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Simulate a user working through their workout plan")
+    parser.add_argument(
+        "--animate",
+        action="store_true",
+        help="Pause between simulated days so the output can be followed (1s unless WORKOUT_DELAY is set)"
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Never pause, even if WORKOUT_DELAY is set"
+    )
+    parser.add_argument(
+        "--weeks",
+        type=int,
+        default=1,
+        help="Number of full passes through the workout plan to simulate (default: 1)"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Write one JSON object per line instead of colored text, and skip the Enter prompt"
+    )
+    parser.add_argument(
+        "--per-set",
+        action="store_true",
+        help="Complete every set through /history/{user_id}/update and /complete instead of the /testing simulate endpoint"
+    )
+
+    args = parser.parse_args()
+    JSON_OUTPUT = args.json
+    PER_SET = args.per_set
+    WEEKS = max(args.weeks, 1)
+    if args.fast:
+        DELAY = 0.0
+    elif args.animate and not DELAY:
+        DELAY = 1.0
+
+    asyncio.run(main())
@@ -9,14 +9,22 @@ Usage:
   python test_search_index.py --category "stretching"
   python test_search_index.py --muscle "hamstrings"
   python test_search_index.py --all  # Run all test queries
+  python test_search_index.py --all --refresh-index-check  # Re-read the index status first
+
+Results are read from the index's storedSource ("returnStoredSource") once the index definition
+includes it. An index created before that needs `python create_search_index.py --update`; until
+the update is READY, searches fetch the full documents as before.
 """
 
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, OperationFailure, ServerSelectionTimeoutError
 import os
 import sys
 import json
+import time
+import atexit
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Import connection settings from connect.py
 from connect import (
@@ -32,6 +40,43 @@ SEARCH_INDEX_NAME = "exercises_prod"
 # Fields that can be searched
 SEARCH_PATHS = ["name", "instructions", "primaryMuscles", "secondaryMuscles", "equipment", "category"]
 
+# Test queries in run_all_tests that are sent to Atlas at the same time when they run separately
+SEARCH_WORKERS = 7
+
+# Remembers that the search index was queryable, so check_index_status can skip the
+# list_search_indexes admin call on later runs (refresh with --refresh-index-check)
+INDEX_READY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "schwitzerlaend", "idx_ready")
+INDEX_READY_CACHE_TTL = 3600  # seconds
+
+# Whether the $search stages use "returnStoredSource", so matches come straight from the index's
+# storedSource fields (see SEARCH_INDEX_DEFINITION in create_search_index.py). Set by
+# check_index_status once the index definition is known to include storedSource; an index created
+# before that needs `python create_search_index.py --update` first.
+USE_STORED_SOURCE = False
+
+# Shared client, created on first use (see get_client)
+_CLIENT = None
+
+
+def get_client():
+    """
+    Return the shared MongoClient, creating it on first use.
+
+    The client owns the connection pool, so reusing it (e.g. when calling main() repeatedly from
+    an interactive session) skips the SRV lookup, TLS handshake and handshake commands of a new
+    client. It is closed when the interpreter exits.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = MongoClient(
+            MONGODB_URI,
+            tls=True,
+            tlsCertificateKeyFile=CERTIFICATE_FILE,
+            serverSelectionTimeoutMS=10000
+        )
+        atexit.register(_CLIENT.close)
+    return _CLIENT
+
 
 def connect_to_mongodb():
     """Connect to MongoDB using X509 certificate authentication."""
@@ -41,12 +86,7 @@ def connect_to_mongodb():
             return None, None, None
 
         print("🔌 Connecting to MongoDB Atlas...")
-        client = MongoClient(
-            MONGODB_URI,
-            tls=True,
-            tlsCertificateKeyFile=CERTIFICATE_FILE,
-            serverSelectionTimeoutMS=10000
-        )
+        client = get_client()
 
         client.admin.command('ping')
         print(f"✅ Connected to MongoDB Atlas")
@@ -63,17 +103,67 @@ def connect_to_mongodb():
         return None, None, None
 
 
-def check_index_status(collection):
-    """Check if the search index is ready."""
+def index_ready_cached():
+    """
+    Return the cached index status if the search index was found queryable within the last
+    INDEX_READY_CACHE_TTL seconds ({"stored_source": bool}), otherwise None.
+    """
+    try:
+        if time.time() - os.path.getmtime(INDEX_READY_CACHE_FILE) >= INDEX_READY_CACHE_TTL:
+            return None
+        with open(INDEX_READY_CACHE_FILE) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if isinstance(cached, dict) and cached.get("index") == SEARCH_INDEX_NAME else None
+
+
+def remember_index_ready(stored_source):
+    """Record that the search index is queryable, and whether it has storedSource (best effort)."""
+    try:
+        os.makedirs(os.path.dirname(INDEX_READY_CACHE_FILE), exist_ok=True)
+        with open(INDEX_READY_CACHE_FILE, "w") as f:
+            json.dump({"index": SEARCH_INDEX_NAME, "stored_source": stored_source}, f)
+    except OSError as e:
+        print(f"⚠️  Could not cache index status: {e}")
+
+
+def check_index_status(collection, refresh=False):
+    """
+    Check if the search index is ready, and enable returnStoredSource (USE_STORED_SOURCE) if its
+    active definition includes storedSource.
+
+    A queryable index is remembered for INDEX_READY_CACHE_TTL seconds, so later runs skip the
+    list_search_indexes call. Pass refresh=True to check again anyway.
+    """
+    global USE_STORED_SOURCE
+
+    cached = None if refresh else index_ready_cached()
+    if cached is not None:
+        USE_STORED_SOURCE = bool(cached.get("stored_source"))
+        print(f"\n📊 Search index '{SEARCH_INDEX_NAME}': queryable (cached), stored source: {USE_STORED_SOURCE}")
+        return True
+
     try:
         indexes = list(collection.list_search_indexes())
         for idx in indexes:
             if idx.get('name') == SEARCH_INDEX_NAME:
                 status = idx.get('status', 'UNKNOWN')
                 queryable = idx.get('queryable', False)
+                # While an updated definition is still building (status other than READY), queries
+                # are served by the previous one, which may not have storedSource yet
+                USE_STORED_SOURCE = (
+                    queryable and status == 'READY'
+                    and 'storedSource' in idx.get('latestDefinition', {})
+                )
                 print(f"\n📊 Search index '{SEARCH_INDEX_NAME}':")
                 print(f"   Status: {status}")
                 print(f"   Queryable: {queryable}")
+                print(f"   Stored source: {USE_STORED_SOURCE}")
+                if queryable and not USE_STORED_SOURCE:
+                    print("   ℹ️  Run `python create_search_index.py --update` to serve results from the index")
+                if queryable:
+                    remember_index_ready(USE_STORED_SOURCE)
                 return queryable
         print(f"⚠️  Search index '{SEARCH_INDEX_NAME}' not found")
         return False
@@ -82,18 +172,25 @@ def check_index_status(collection):
         return True  # Assume it's ready if we can't check
 
 
-def search_all_fields(collection, query_text, limit=10):
-    """Search across all fields."""
-    pipeline = [
+def search_stage(operator):
+    """Build the body of a $search stage on the exercises index for the given operator."""
+    stage = {"index": SEARCH_INDEX_NAME, **operator}
+    if USE_STORED_SOURCE:
+        stage["returnStoredSource"] = True
+    return stage
+
+
+def build_all_fields_pipeline(query_text, limit=10):
+    """Build the pipeline that searches across all fields."""
+    return [
         {
-            "$search": {
-                "index": SEARCH_INDEX_NAME,
+            "$search": search_stage({
                 "text": {
                     "query": query_text,
                     "path": SEARCH_PATHS,
                     "fuzzy": {"maxEdits": 2, "prefixLength": 2}
                 }
-            }
+            })
         },
         {
             "$project": {
@@ -108,20 +205,23 @@ def search_all_fields(collection, query_text, limit=10):
         {"$sort": {"score": -1}},
         {"$limit": limit}
     ]
-    return list(collection.aggregate(pipeline))
 
 
-def search_by_field(collection, query_text, field, limit=10):
-    """Search in a specific field."""
-    pipeline = [
+def search_all_fields(collection, query_text, limit=10):
+    """Search across all fields."""
+    return list(collection.aggregate(build_all_fields_pipeline(query_text, limit)))
+
+
+def build_field_pipeline(query_text, field, limit=10):
+    """Build the pipeline that searches in a specific field."""
+    return [
         {
-            "$search": {
-                "index": SEARCH_INDEX_NAME,
+            "$search": search_stage({
                 "text": {
                     "query": query_text,
                     "path": field
                 }
-            }
+            })
         },
         {
             "$project": {
@@ -134,11 +234,15 @@ def search_by_field(collection, query_text, field, limit=10):
         {"$sort": {"score": -1}},
         {"$limit": limit}
     ]
-    return list(collection.aggregate(pipeline))
 
 
-def search_with_filters(collection, query_text, filters=None, limit=10):
-    """Search with filters (equipment, category, muscles, etc.)."""
+def search_by_field(collection, query_text, field, limit=10):
+    """Search in a specific field."""
+    return list(collection.aggregate(build_field_pipeline(query_text, field, limit)))
+
+
+def build_filters_pipeline(query_text, filters=None, limit=10):
+    """Build the pipeline that searches with filters (equipment, category, muscles, etc.)."""
     must = []
     filter_clauses = []
 
@@ -170,12 +274,9 @@ def search_with_filters(collection, query_text, filters=None, limit=10):
     if not compound:
         compound = {"must": [{"text": {"query": "", "path": SEARCH_PATHS}}]}
 
-    pipeline = [
+    return [
         {
-            "$search": {
-                "index": SEARCH_INDEX_NAME,
-                "compound": compound
-            }
+            "$search": search_stage({"compound": compound})
         },
         {
             "$project": {
@@ -191,42 +292,44 @@ def search_with_filters(collection, query_text, filters=None, limit=10):
         {"$sort": {"score": -1}},
         {"$limit": limit}
     ]
-    return list(collection.aggregate(pipeline))
+
+
+def search_with_filters(collection, query_text, filters=None, limit=10):
+    """Search with filters (equipment, category, muscles, etc.)."""
+    return list(collection.aggregate(build_filters_pipeline(query_text, filters, limit)))
 
 
 def display_results(results, title="Search Results"):
     """Display search results in a readable format."""
-    print(f"\n{'='*60}")
-    print(f"🔍 {title}")
-    print(f"{'='*60}")
+    # Build the whole block first and write it in one call instead of printing line by line
+    lines = [f"\n{'='*60}", f"🔍 {title}", f"{'='*60}"]
     
     if not results:
-        print("❌ No results found")
+        lines.append("❌ No results found")
+        sys.stdout.write("\n".join(lines) + "\n")
         return
 
-    print(f"📊 Found {len(results)} result(s):\n")
+    lines.append(f"📊 Found {len(results)} result(s):\n")
     
     for i, doc in enumerate(results, 1):
-        print(f"{i}. {doc.get('name', 'Unknown')} (ID: {doc.get('_id', 'N/A')})")
-        print(f"   Score: {doc.get('score', 0):.4f}")
+        lines.append(f"{i}. {doc.get('name', 'Unknown')} (ID: {doc.get('_id', 'N/A')})")
+        lines.append(f"   Score: {doc.get('score', 0):.4f}")
         
-        if 'category' in doc:
-            print(f"   Category: {doc['category']}")
-        if 'equipment' in doc:
-            print(f"   Equipment: {doc['equipment']}")
-        if 'primaryMuscles' in doc:
-            muscles = doc['primaryMuscles']
-            if isinstance(muscles, list):
-                print(f"   Primary Muscles: {', '.join(muscles)}")
-            else:
-                print(f"   Primary Muscles: {muscles}")
-        if 'secondaryMuscles' in doc:
-            muscles = doc['secondaryMuscles']
-            if isinstance(muscles, list):
-                print(f"   Secondary Muscles: {', '.join(muscles)}")
-            else:
-                print(f"   Secondary Muscles: {muscles}")
-        print()
+        category = doc.get('category')
+        if category is not None:
+            lines.append(f"   Category: {category}")
+        equipment = doc.get('equipment')
+        if equipment is not None:
+            lines.append(f"   Equipment: {equipment}")
+        for label, key in (("Primary Muscles", 'primaryMuscles'), ("Secondary Muscles", 'secondaryMuscles')):
+            muscles = doc.get(key)
+            if muscles is not None:
+                if isinstance(muscles, list):
+                    muscles = ', '.join(muscles)
+                lines.append(f"   {label}: {muscles}")
+        lines.append("")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def run_all_tests(collection):
@@ -236,20 +339,63 @@ def run_all_tests(collection):
     print("="*60)
 
     tests = [
-        ("Search: 'hamstring'", lambda: search_all_fields(collection, "hamstring", limit=5)),
-        ("Search: 'push up'", lambda: search_all_fields(collection, "push up", limit=5)),
-        ("Search by name: '90'", lambda: search_by_field(collection, "90", "name", limit=5)),
-        ("Search by equipment: 'body only'", lambda: search_by_field(collection, "body only", "equipment", limit=5)),
-        ("Search by category: 'stretching'", lambda: search_by_field(collection, "stretching", "category", limit=5)),
+        ("Search: 'hamstring'", build_all_fields_pipeline("hamstring", limit=5)),
+        ("Search: 'push up'", build_all_fields_pipeline("push up", limit=5)),
+        ("Search by name: '90'", build_field_pipeline("90", "name", limit=5)),
+        ("Search by equipment: 'body only'", build_field_pipeline("body only", "equipment", limit=5)),
+        ("Search by category: 'stretching'", build_field_pipeline("stretching", "category", limit=5)),
         ("Search with filter: equipment='body only'", 
-         lambda: search_with_filters(collection, "", {"equipment": "body only"}, limit=5)),
+         build_filters_pipeline("", {"equipment": "body only"}, limit=5)),
         ("Search: 'triceps' + filter category='strength'", 
-         lambda: search_with_filters(collection, "triceps", {"category": "strength"}, limit=5)),
+         build_filters_pipeline("triceps", {"category": "strength"}, limit=5)),
     ]
 
-    for test_name, test_func in tests:
+    # Run the whole suite as one aggregate: the first test runs on the collection and every other
+    # test is appended with $unionWith ($search is not allowed inside $facet). Each branch tags its
+    # documents with the test's position so the results can be split up again.
+    pipeline = tests[0][1] + [{"$set": {"_test": 0}}]
+    for i, (_, test_pipeline) in enumerate(tests[1:], 1):
+        pipeline.append({
+            "$unionWith": {
+                "coll": COLLECTION_NAME,
+                "pipeline": test_pipeline + [{"$set": {"_test": i}}]
+            }
+        })
+
+    try:
+        docs = list(collection.aggregate(pipeline))
+    except OperationFailure as e:
+        # One bad branch fails the whole aggregate; rerun the tests separately to find out which
+        print(f"\n⚠️  Combined test query failed ({e}), running each test separately")
+        run_tests_separately(collection, tests)
+        return
+    except Exception as e:
+        print(f"\n❌ Test queries failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return
+
+    results = [[] for _ in tests]
+    for doc in docs:
+        results[doc.pop("_test")].append(doc)
+
+    for (test_name, _), test_results in zip(tests, results):
+        display_results(test_results, test_name)
+
+
+def run_tests_separately(collection, tests):
+    """Run each test pipeline as its own aggregate and report failures per test."""
+    # The queries are independent, so run them concurrently over the client's connection pool
+    # and display the results in the original order
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        futures = [
+            (test_name, executor.submit(lambda p: list(collection.aggregate(p)), test_pipeline))
+            for test_name, test_pipeline in tests
+        ]
+
+    for test_name, future in futures:
         try:
-            results = test_func()
+            results = future.result()
             display_results(results, test_name)
         except Exception as e:
             print(f"\n❌ Test '{test_name}' failed: {e}")
@@ -269,6 +415,8 @@ def main():
     parser.add_argument("--all", action="store_true", help="Run all test queries")
     parser.add_argument("--limit", type=int, default=10, help="Maximum number of results")
     parser.add_argument("--json", action="store_true", help="Output results as JSON")
+    parser.add_argument("--refresh-index-check", action="store_true",
+                        help="Check the search index status even if it was recently found ready")
 
     args = parser.parse_args()
 
@@ -277,11 +425,10 @@ def main():
         sys.exit(1)
 
     # Check index status
-    if not check_index_status(collection):
+    if not check_index_status(collection, refresh=args.refresh_index_check):
         print("\n⚠️  Warning: Index may not be ready yet. Queries might fail.")
         response = input("Continue anyway? (y/n): ")
         if response.lower() != 'y':
-            client.close()
             sys.exit(0)
 
     try:
@@ -328,10 +475,6 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
-    finally:
-        if client:
-            client.close()
-            print("\n🔌 Connection closed.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""Semantic response cache for AI-generated workout plans."""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_COLLECTION_NAME = "workout_cache"
+# Atlas Vector Search index on workout_cache.prompt_embedding (see create_search_index.py --workout-cache)
+CACHE_VECTOR_INDEX_NAME = "workout_cache_vector"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+CACHE_TTL = timedelta(days=7)
+# Minimum cosine similarity for a near-duplicate prompt to count as a hit
+SIMILARITY_THRESHOLD = 0.92
+# Atlas reports cosine similarity normalized as (1 + cosine) / 2
+_VECTOR_SCORE_THRESHOLD = (1 + SIMILARITY_THRESHOLD) / 2
+# A user's own recent workouts are reused for prompts at least this similar
+USER_WORKOUT_SIMILARITY_THRESHOLD = 0.95
+RECENT_USER_WORKOUTS = 5
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lower-case and collapse whitespace so trivially different prompts share a key."""
+    return " ".join(prompt.lower().split())
+
+
+def hash_prompt(prompt: str) -> str:
+    """Return the exact-match cache key for a prompt."""
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Version tag derived from the system prompt, so edits to prompt.txt invalidate the cache."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def ensure_cache_indexes(db):
+    """Create the exact-match and TTL indexes for the cache collection."""
+    collection = db[CACHE_COLLECTION_NAME]
+    collection.create_index([("prompt_hash", 1), ("prompt_version", 1)])
+    collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+def embed_prompt(prompt: str, openai_client) -> List[float]:
+    """Embed a single prompt for the similarity lookup."""
+    response = openai_client.embeddings.create(model=EMBEDDING_MODEL, input=normalize_prompt(prompt))
+    return response.data[0].embedding
+
+
+def find_similar_user_workout(workout_docs: List[Dict[str, Any]], embedding: List[float]) -> Optional[Dict[str, Any]]:
+    """
+    Return the workout whose stored prompt embedding is most similar to the given one,
+    if it reaches USER_WORKOUT_SIMILARITY_THRESHOLD.
+
+    OpenAI embeddings are unit-normalized, so the dot product is the cosine similarity.
+    """
+    best_doc = None
+    best_score = USER_WORKOUT_SIMILARITY_THRESHOLD
+    for workout_doc in workout_docs:
+        stored = workout_doc.get('prompt_embedding')
+        if not stored or len(stored) != len(embedding):
+            continue
+        score = sum(a * b for a, b in zip(stored, embedding))
+        if score >= best_score:
+            best_doc, best_score = workout_doc, score
+
+    if best_doc is not None:
+        logger.info(f"✅ Prompt matches existing user workout {best_doc['_id']} (similarity: {best_score:.4f})")
+    return best_doc
+
+
+def lookup_cached_workout(db, prompt: str, version: str, openai_client, embedding: Optional[List[float]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Look up a cached workout plan for the prompt.
+
+    Tries an exact hash match first, then a vector search over recent prompts.
+    Pass a precomputed prompt embedding to avoid embedding the prompt again.
+    Returns (workout_plan_data or None, prompt embedding or None). The embedding is
+    returned on a miss so the caller can reuse it when storing the new plan.
+    """
+    collection = db[CACHE_COLLECTION_NAME]
+    now = datetime.utcnow()
+
+    cached = collection.find_one(
+        {'prompt_hash': hash_prompt(prompt), 'prompt_version': version, 'expires_at': {'$gt': now}},
+        {'workout_plan_data': 1}
+    )
+    if cached:
+        logger.info("✅ Workout cache hit (exact prompt match)")
+        return cached['workout_plan_data'], embedding
+
+    if embedding is None:
+        try:
+            embedding = embed_prompt(prompt, openai_client)
+        except Exception as e:
+            logger.warning(f"Failed to embed prompt for cache lookup: {e}")
+            return None, None
+
+    try:
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": CACHE_VECTOR_INDEX_NAME,
+                    "path": "prompt_embedding",
+                    "queryVector": embedding,
+                    "numCandidates": 50,
+                    "limit": 1,
+                    "filter": {"prompt_version": version, "expires_at": {"$gt": now}}
+                }
+            },
+            {"$project": {"workout_plan_data": 1, "score": {"$meta": "vectorSearchScore"}}}
+        ]
+        results = list(collection.aggregate(pipeline))
+    except Exception as e:
+        logger.warning(f"Workout cache vector search failed: {e}")
+        return None, embedding
+
+    if results and results[0].get('score', 0) >= _VECTOR_SCORE_THRESHOLD:
+        logger.info(f"✅ Workout cache hit (similar prompt, score: {results[0]['score']:.4f})")
+        return results[0]['workout_plan_data'], embedding
+
+    logger.info("Workout cache miss")
+    return None, embedding
+
+
+def store_cached_workout(db, prompt: str, version: str, embedding: Optional[List[float]], workout_plan_data: Dict[str, Any]):
+    """Store a generated workout plan so identical or similar prompts can reuse it."""
+    now = datetime.utcnow()
+    doc = {
+        'prompt_hash': hash_prompt(prompt),
+        'prompt_version': version,
+        'workout_plan_data': workout_plan_data,
+        'created_at': now,
+        'expires_at': now + CACHE_TTL
+    }
+    if embedding is not None:
+        doc['prompt_embedding'] = embedding
+
+    try:
+        db[CACHE_COLLECTION_NAME].insert_one(doc)
+    except Exception as e:
+        logger.warning(f"Failed to store workout plan in cache: {e}")